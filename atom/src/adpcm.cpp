@@ -0,0 +1,62 @@
+#include "adpcm.hpp"
+
+static const int8_t INDEX_TABLE[16] = {-1, -1, -1, -1, 2, 4, 6, 8,
+                                       -1, -1, -1, -1, 2, 4, 6, 8};
+
+static const int16_t STEP_TABLE[89] = {
+    7,     8,     9,     10,    11,    12,    13,    14,    16,    17,
+    19,    21,    23,    25,    28,    31,    34,    37,    41,    45,
+    50,    55,    60,    66,    73,    80,    88,    97,    107,   118,
+    130,   143,   157,   173,   190,   209,   230,   253,   279,   307,
+    337,   371,   408,   449,   494,   544,   598,   658,   724,   796,
+    876,   963,   1060,  1166,  1282,  1411,  1552,  1707,  1878,  2066,
+    2272,  2499,  2749,  3024,  3327,  3660,  4026,  4428,  4871,  5358,
+    5894,  6484,  7132,  7845,  8630,  9493,  10442, 11487, 12635, 13899,
+    15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794, 32767};
+
+size_t adpcmEncodeBlock(AdpcmState &state, const int16_t *samples,
+                        size_t num_samples, uint8_t *out) {
+  out[0] = state.predictor & 0xFF;
+  out[1] = (state.predictor >> 8) & 0xFF;
+  out[2] = (uint8_t)state.index;
+  out[3] = 0;
+  uint8_t *data = out + ADPCM_HEADER_SIZE;
+
+  for (size_t i = 0; i < num_samples; i++) {
+    int32_t step = STEP_TABLE[state.index];
+    int32_t diff = samples[i] - state.predictor;
+    uint8_t code = 0;
+    if (diff < 0) {
+      code = 8;
+      diff = -diff;
+    }
+    int32_t diffq = step >> 3;
+    if (diff >= step) {
+      code |= 4;
+      diff -= step;
+      diffq += step;
+    }
+    step >>= 1;
+    if (diff >= step) {
+      code |= 2;
+      diff -= step;
+      diffq += step;
+    }
+    step >>= 1;
+    if (diff >= step) {
+      code |= 1;
+      diffq += step;
+    }
+
+    state.predictor += (code & 8) ? -diffq : diffq;
+    state.predictor = constrain(state.predictor, -32768, 32767);
+    state.index = constrain(state.index + INDEX_TABLE[code], 0, 88);
+
+    if (i % 2 == 0) {
+      data[i / 2] = code;
+    } else {
+      data[i / 2] |= code << 4;
+    }
+  }
+  return adpcmBlockSize(num_samples);
+}
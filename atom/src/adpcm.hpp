@@ -0,0 +1,22 @@
+#pragma once
+
+#include <Arduino.h>
+
+// Codificador IMA ADPCM (4 bits por muestra). Cada bloque lleva una cabecera
+// de 4 bytes (predictor int16, índice de paso u8, relleno) para que el
+// servidor pueda decodificarlo de forma independiente (ver src/audio_codec.py).
+struct AdpcmState {
+  int32_t predictor = 0;
+  int32_t index = 0;
+};
+
+#define ADPCM_HEADER_SIZE 4
+
+// Tamaño en bytes de un bloque codificado de 'num_samples' muestras.
+inline size_t adpcmBlockSize(size_t num_samples) {
+  return ADPCM_HEADER_SIZE + (num_samples + 1) / 2;
+}
+
+// Codifica 'num_samples' muestras en 'out' y devuelve los bytes escritos.
+size_t adpcmEncodeBlock(AdpcmState &state, const int16_t *samples,
+                        size_t num_samples, uint8_t *out);
@@ -195,12 +195,10 @@ void loop() {
 #endif
 
       if (client.connected()) {
-        size_t bytes_sent =
-            client.write((const uint8_t *)capture_buffer, bytes_read);
-        if (bytes_sent != bytes_read) {
-          Serial.printf(
-              "Error enviando datos: %d de %d bytes enviados. Desconectando.\n",
-              bytes_sent, bytes_read);
+        if (!sendAudioFrame(client, (const uint8_t *)capture_buffer,
+                            bytes_read)) {
+          Serial.printf("Error enviando %d bytes de audio. Desconectando.\n",
+                        bytes_read);
           client.stop();
           trasmissione_attiva = false;
           g_isRecording = false;
@@ -220,7 +218,7 @@ void loop() {
       Serial.println("Botón soltado o cliente desconectado, deteniendo "
                      "transmisión de audio.");
       if (client.connected()) {
-        client.write("[END]");
+        sendEndOfUtterance(client);
       }
       trasmissione_attiva = false;
       g_isRecording = false;
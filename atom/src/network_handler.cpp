@@ -1,4 +1,6 @@
 #include "network_handler.hpp"
+#include "adpcm.hpp"
+#include "mic.hpp"
 #include <Arduino.h>
 #include "WiFi.h"
 
@@ -16,6 +18,7 @@ bool manageClientConnection(WiFiClient& client,
         Serial.printf("Intentando conectar al servidor %s:%d\n", server_ip, server_port);
         if (client.connect(server_ip, server_port)) {
             Serial.println("Conectado al servidor!");
+            sendStreamHeader(client, sampleRate);
             if (trasmissione_attiva) {
                 Serial.println("Cliente reconectado, deteniendo transmisión previa si estaba activa.");
                 trasmissione_attiva = false;
@@ -34,6 +37,61 @@ bool manageClientConnection(WiFiClient& client,
     return true;
 }
 
+bool sendStreamHeader(WiFiClient& client, uint32_t sample_rate) {
+#if USE_FRAMED_PROTOCOL
+    uint8_t header[12] = {'E', 'S', 'P', 'W', PROTOCOL_VERSION, AUDIO_CODEC, 1, 0};
+    header[8] = sample_rate & 0xFF;
+    header[9] = (sample_rate >> 8) & 0xFF;
+    header[10] = (sample_rate >> 16) & 0xFF;
+    header[11] = (sample_rate >> 24) & 0xFF;
+    return client.write(header, sizeof(header)) == sizeof(header);
+#else
+    return true;
+#endif
+}
+
+static bool sendFrame(WiFiClient& client, uint8_t type, const uint8_t* data, size_t len) {
+    uint8_t frame_header[3] = {type, (uint8_t)(len & 0xFF), (uint8_t)((len >> 8) & 0xFF)};
+    if (client.write(frame_header, sizeof(frame_header)) != sizeof(frame_header)) {
+        return false;
+    }
+    return len == 0 || client.write(data, len) == len;
+}
+
+#if AUDIO_CODEC == CODEC_IMA_ADPCM
+static AdpcmState adpcm_state;
+// Bloque de 1024 muestras (lo que entrega cada i2s_read) codificado.
+static uint8_t adpcm_block[ADPCM_HEADER_SIZE + 512];
+#endif
+
+bool sendAudioFrame(WiFiClient& client, const uint8_t* data, size_t len) {
+#if USE_FRAMED_PROTOCOL && AUDIO_CODEC == CODEC_IMA_ADPCM
+    const int16_t* samples = (const int16_t*)data;
+    size_t num_samples = len / sizeof(int16_t);
+    const size_t max_samples = (sizeof(adpcm_block) - ADPCM_HEADER_SIZE) * 2;
+    for (size_t offset = 0; offset < num_samples; offset += max_samples) {
+        size_t block_samples = min(max_samples, num_samples - offset);
+        size_t block_len = adpcmEncodeBlock(adpcm_state, samples + offset, block_samples, adpcm_block);
+        if (!sendFrame(client, FRAME_AUDIO, adpcm_block, block_len)) {
+            return false;
+        }
+    }
+    return true;
+#elif USE_FRAMED_PROTOCOL
+    return sendFrame(client, FRAME_AUDIO, data, len);
+#else
+    return client.write(data, len) == len;
+#endif
+}
+
+void sendEndOfUtterance(WiFiClient& client) {
+#if USE_FRAMED_PROTOCOL
+    sendFrame(client, FRAME_END, nullptr, 0);
+#else
+    client.write("[END]");
+#endif
+}
+
 const char* getWifiStatusString(wl_status_t status) {
   switch (status) {
     case WL_NO_SSID_AVAIL:
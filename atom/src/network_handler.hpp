@@ -17,6 +17,33 @@ bool manageClientConnection(WiFiClient& client,
 
 extern bool trying_to_connect;
 
+// Protocolo enmarcado con el servidor (ver src/protocol.py).
+// Con USE_FRAMED_PROTOCOL a 0 se envía PCM crudo y "[END]" como antes.
+#define USE_FRAMED_PROTOCOL 1
+
+#define PROTOCOL_VERSION 1
+#define CODEC_PCM16 0
+#define CODEC_IMA_ADPCM 1
+
+// Códec del audio enviado con el protocolo enmarcado. ADPCM reduce el
+// ancho de banda a una cuarta parte (64 kbit/s a 16 kHz).
+#define AUDIO_CODEC CODEC_PCM16
+
+#define FRAME_AUDIO 1
+#define FRAME_END 2
+#define FRAME_PING 3
+#define FRAME_CONFIG 4
+
+// Cabecera inicial: magic "ESPW", versión, codec, canales y frecuencia de muestreo.
+bool sendStreamHeader(WiFiClient& client, uint32_t sample_rate);
+
+// Envía una trama AUDIO (codificada con AUDIO_CODEC).
+// Retorna 'true' si se escribieron todos los bytes.
+bool sendAudioFrame(WiFiClient& client, const uint8_t* data, size_t len);
+
+// Marca el final de la elocución.
+void sendEndOfUtterance(WiFiClient& client);
+
 bool try_connect_wifi(char* ssid, char* password);
 
 #endif // NETWORK_HANDLER_HPP
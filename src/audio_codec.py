@@ -0,0 +1,219 @@
+"""
+Códecs de audio comprimido para el transporte cliente-servidor.
+
+- IMA ADPCM (4 bits por muestra, 64 kbit/s a 16 kHz): lo bastante barato para
+  codificarse en el ESP32. Cada trama AUDIO es un bloque independiente con
+  una cabecera de 4 bytes (predictor int16, índice de paso u8, relleno u8)
+  seguida de dos muestras por byte (nibble bajo primero).
+- Opus (vía `opuslib`, opcional): para `local_client.py`. Cada trama AUDIO
+  lleva un paquete Opus de 20 ms.
+
+El servidor decodifica a PCM de 16 bits antes de pasar el audio al motor.
+Los bucles ADPCM se compilan con numba la primera vez que se usan (o en
+`warm_up()`), no al importar: un servidor con dispositivos PCM no carga
+numba/llvmlite.
+"""
+
+import struct
+import threading
+
+import numpy as np
+
+import protocol
+
+try:
+    import opuslib
+except ImportError:
+    opuslib = None
+
+CODEC_NAMES = {
+    "pcm": protocol.CODEC_PCM16,
+    "adpcm": protocol.CODEC_IMA_ADPCM,
+    "opus": protocol.CODEC_OPUS,
+}
+
+ADPCM_HEADER = struct.Struct("<hBx")
+OPUS_FRAME_MS = 20
+
+INDEX_TABLE = np.array([-1, -1, -1, -1, 2, 4, 6, 8] * 2, dtype=np.int32)
+STEP_TABLE = np.array(
+    [
+        7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41,
+        45, 50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190,
+        209, 230, 253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724,
+        796, 876, 963, 1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272,
+        2499, 2749, 3024, 3327, 3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132,
+        7845, 8630, 9493, 10442, 11487, 12635, 13899, 15289, 16818, 18500,
+        20350, 22385, 24623, 27086, 29794, 32767,
+    ],
+    dtype=np.int32,
+)
+
+
+def _adpcm_encode(samples, out, predictor, index, index_table, step_table):
+    for i in range(len(samples)):
+        step = step_table[index]
+        diff = samples[i] - predictor
+        code = 0
+        if diff < 0:
+            code = 8
+            diff = -diff
+        diffq = step >> 3
+        if diff >= step:
+            code |= 4
+            diff -= step
+            diffq += step
+        step >>= 1
+        if diff >= step:
+            code |= 2
+            diff -= step
+            diffq += step
+        step >>= 1
+        if diff >= step:
+            code |= 1
+            diffq += step
+
+        predictor = predictor - diffq if code & 8 else predictor + diffq
+        predictor = min(max(predictor, -32768), 32767)
+        index = min(max(index + index_table[code], 0), 88)
+
+        if i % 2 == 0:
+            out[i // 2] = code
+        else:
+            out[i // 2] |= code << 4
+    return predictor, index
+
+
+def _adpcm_decode(data, out, predictor, index, index_table, step_table):
+    for i in range(len(out)):
+        byte = data[i // 2]
+        code = byte & 0x0F if i % 2 == 0 else byte >> 4
+        step = step_table[index]
+        diffq = step >> 3
+        if code & 4:
+            diffq += step
+        if code & 2:
+            diffq += step >> 1
+        if code & 1:
+            diffq += step >> 2
+
+        predictor = predictor - diffq if code & 8 else predictor + diffq
+        predictor = min(max(predictor, -32768), 32767)
+        index = min(max(index + index_table[code], 0), 88)
+        out[i] = predictor
+
+
+_kernels = None
+_kernels_lock = threading.Lock()
+
+
+def _adpcm_kernels():
+    """(codificar, decodificar), compilados con numba si está disponible."""
+    global _kernels
+    with _kernels_lock:
+        if _kernels is None:
+            try:
+                from numba import njit
+            except ImportError:
+                print(
+                    "Advertencia: No se encontró 'numba'. La decodificación ADPCM "
+                    "usará Python puro (más lento)."
+                )
+                _kernels = (_adpcm_encode, _adpcm_decode)
+            else:
+                _kernels = (
+                    njit(cache=True)(_adpcm_encode),
+                    njit(cache=True)(_adpcm_decode),
+                )
+        return _kernels
+
+
+def warm_up():
+    """Compila los bucles ADPCM con un bloque de prueba, fuera de las sesiones."""
+    packet = AdpcmEncoder().encode(bytes(64))[0]
+    AdpcmDecoder().decode(memoryview(packet))
+
+
+class AdpcmEncoder:
+    def __init__(self):
+        self.predictor = 0
+        self.index = 0
+        self._encode = _adpcm_kernels()[0]
+
+    def encode(self, pcm: bytes) -> list[bytes]:
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        packets = []
+        # Cada paquete debe caber en una trama del protocolo.
+        max_samples = (protocol.MAX_PAYLOAD - ADPCM_HEADER.size) * 2
+        for start in range(0, len(samples), max_samples):
+            block = samples[start : start + max_samples].astype(np.int32)
+            out = np.zeros((len(block) + 1) // 2, dtype=np.uint8)
+            header = ADPCM_HEADER.pack(self.predictor, self.index)
+            self.predictor, self.index = self._encode(
+                block, out, self.predictor, self.index, INDEX_TABLE, STEP_TABLE
+            )
+            packets.append(header + out.tobytes())
+        return packets
+
+
+class AdpcmDecoder:
+    def __init__(self, max_samples: int = protocol.MAX_PAYLOAD * 2):
+        self.output = np.empty(max_samples, dtype=np.int16)
+        self._decode = _adpcm_kernels()[1]
+
+    def decode(self, payload: memoryview) -> memoryview:
+        predictor, index = ADPCM_HEADER.unpack_from(payload, 0)
+        data = np.frombuffer(payload, dtype=np.uint8, offset=ADPCM_HEADER.size)
+        out = self.output[: len(data) * 2]
+        self._decode(data, out, predictor, min(index, 88), INDEX_TABLE, STEP_TABLE)
+        return memoryview(out).cast("B")
+
+
+class OpusEncoder:
+    def __init__(self, sample_rate: int, channels: int):
+        if opuslib is None:
+            raise RuntimeError("El códec Opus necesita la librería 'opuslib'.")
+        self.encoder = opuslib.Encoder(sample_rate, channels, opuslib.APPLICATION_VOIP)
+        self.frame_samples = sample_rate * OPUS_FRAME_MS // 1000
+        self.frame_bytes = self.frame_samples * 2 * channels
+        self.pending = bytearray()
+
+    def encode(self, pcm: bytes) -> list[bytes]:
+        self.pending.extend(pcm)
+        packets = []
+        while len(self.pending) >= self.frame_bytes:
+            frame = bytes(self.pending[: self.frame_bytes])
+            del self.pending[: self.frame_bytes]
+            packets.append(self.encoder.encode(frame, self.frame_samples))
+        return packets
+
+
+class OpusDecoder:
+    def __init__(self, sample_rate: int, channels: int):
+        if opuslib is None:
+            raise RuntimeError("El códec Opus necesita la librería 'opuslib'.")
+        self.decoder = opuslib.Decoder(sample_rate, channels)
+        self.frame_samples = sample_rate * OPUS_FRAME_MS // 1000
+
+    def decode(self, payload: memoryview) -> memoryview:
+        # Se devuelve un bytearray para que la ganancia pueda aplicarse in-place.
+        return memoryview(bytearray(self.decoder.decode(bytes(payload), self.frame_samples)))
+
+
+def create_encoder(codec: int, sample_rate: int, channels: int = 1):
+    if codec == protocol.CODEC_IMA_ADPCM:
+        return AdpcmEncoder()
+    if codec == protocol.CODEC_OPUS:
+        return OpusEncoder(sample_rate, channels)
+    raise ValueError(f"Códec {codec} sin codificador.")
+
+
+def create_decoder(codec: int, sample_rate: int, channels: int = 1):
+    """Devuelve un decodificador para el códec, o None si el audio ya es PCM."""
+    if codec == protocol.CODEC_PCM16:
+        return None
+    if codec == protocol.CODEC_IMA_ADPCM:
+        return AdpcmDecoder()
+    if codec == protocol.CODEC_OPUS:
+        return OpusDecoder(sample_rate, channels)
+    raise protocol.ProtocolError(f"Códec {codec} no soportado.")
@@ -0,0 +1,155 @@
+"""
+Compara los códecs de transporte (PCM crudo, IMA ADPCM y Opus) sobre un
+directorio de grabaciones de 16 kHz: ancho de banda, CPU de decodificación en
+el servidor, SNR y, opcionalmente, la precisión de la transcripción (WER).
+
+Uso:
+    python bench_codec.py grabaciones/ [--engine vosk --model ./models/vosk-model-es-0.42]
+                                       [--json resultados.json]
+
+Si junto a `x.wav` existe `x.txt` se usa como referencia para el WER; si no,
+la referencia es la transcripción del PCM crudo.
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+import audio_codec
+import escritor as esc
+import protocol
+from utils import load_pcm16, word_error_rate
+
+SAMPLE_RATE = 16000
+# Mismo tamaño de bloque que el firmware (1024 muestras por i2s_read).
+CHUNK_SAMPLES = 1024
+
+
+def load_recordings(directory: str) -> list[tuple[str, bytes, str | None]]:
+    recordings = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith((".wav", ".pcm")):
+            continue
+        path = os.path.join(directory, name)
+        reference_path = os.path.splitext(path)[0] + ".txt"
+        reference = None
+        if os.path.exists(reference_path):
+            with open(reference_path, encoding="utf-8") as f:
+                reference = f.read().strip()
+        recordings.append((name, load_pcm16(path, SAMPLE_RATE), reference))
+    return recordings
+
+
+def roundtrip(codec: int, pcm: bytes) -> tuple[bytes, int, float]:
+    """Codifica como el cliente y decodifica como el servidor.
+    Devuelve el PCM decodificado, los bytes en el cable y la CPU de decodificación."""
+    if codec == protocol.CODEC_PCM16:
+        frames = [
+            pcm[i : i + CHUNK_SAMPLES * 2] for i in range(0, len(pcm), CHUNK_SAMPLES * 2)
+        ]
+        wire_bytes = sum(protocol.FRAME_HEADER.size + len(f) for f in frames)
+        return pcm, wire_bytes, 0.0
+
+    encoder = audio_codec.create_encoder(codec, SAMPLE_RATE)
+    decoder = audio_codec.create_decoder(codec, SAMPLE_RATE)
+    packets = []
+    for i in range(0, len(pcm), CHUNK_SAMPLES * 2):
+        packets.extend(encoder.encode(pcm[i : i + CHUNK_SAMPLES * 2]))
+    wire_bytes = sum(protocol.FRAME_HEADER.size + len(p) for p in packets)
+
+    decoded = bytearray()
+    start = time.process_time()
+    for packet in packets:
+        decoded.extend(decoder.decode(memoryview(packet)))
+    decode_cpu = time.process_time() - start
+    return bytes(decoded), wire_bytes, decode_cpu
+
+
+def snr_db(original: bytes, decoded: bytes) -> float:
+    length = min(len(original), len(decoded)) // 2
+    x = np.frombuffer(original, dtype=np.int16)[:length].astype(np.float64)
+    y = np.frombuffer(decoded, dtype=np.int16)[:length].astype(np.float64)
+    noise = np.sum((x - y) ** 2)
+    if noise == 0:
+        return float("inf")
+    return float(10 * np.log10(np.sum(x**2) / noise))
+
+
+def transcribe(engine: esc.TranscriptionEngine, pcm: bytes) -> str:
+    engine.reset()
+    for i in range(0, len(pcm), CHUNK_SAMPLES * 2):
+        engine.accept_waveform(pcm[i : i + CHUNK_SAMPLES * 2])
+    text = engine.get_final_result()
+    engine.reset()
+    return text
+
+
+def build_engine(name: str, model: str) -> esc.TranscriptionEngine:
+    if name == "vosk":
+        return esc.create_engine(name, model_path=model, sample_rate=SAMPLE_RATE)
+    language = "spanish" if name == "whisper" else "es"
+    return esc.create_engine(
+        name, model_name=model, sample_rate=SAMPLE_RATE, language=language
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("directory")
+    parser.add_argument("--engine", choices=list(esc.ENGINES))
+    parser.add_argument("--model")
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    recordings = load_recordings(args.directory)
+    if not recordings:
+        parser.error(f"No hay grabaciones .wav/.pcm en '{args.directory}'.")
+    engine = build_engine(args.engine, args.model) if args.engine else None
+    # Fuera del cronómetro: la primera decodificación ADPCM compilaría los
+    # bucles con numba y se mediría la compilación, no el códec.
+    audio_codec.warm_up()
+
+    codecs = ["pcm", "adpcm"] + (["opus"] if audio_codec.opuslib else [])
+    references = {}
+    results = []
+    for codec_name in codecs:
+        codec = audio_codec.CODEC_NAMES[codec_name]
+        audio_seconds = wire_bytes = decode_cpu = 0.0
+        snrs, wers = [], []
+        for name, pcm, reference in recordings:
+            decoded, sent, cpu = roundtrip(codec, pcm)
+            audio_seconds += len(pcm) / 2 / SAMPLE_RATE
+            wire_bytes += sent
+            decode_cpu += cpu
+            snrs.append(snr_db(pcm, decoded))
+            if engine is not None:
+                text = transcribe(engine, decoded)
+                if codec == protocol.CODEC_PCM16:
+                    references[name] = reference if reference is not None else text
+                wers.append(word_error_rate(references[name], text))
+
+        result = {
+            "codec": codec_name,
+            "kbit_per_second": wire_bytes * 8 / 1000 / audio_seconds,
+            "decode_cpu_ms_per_audio_second": decode_cpu * 1000 / audio_seconds,
+            "snr_db": float(np.median(snrs)),
+            "wer": float(np.mean(wers)) if wers else None,
+        }
+        results.append(result)
+        wer = f"{result['wer']:.3f}" if result["wer"] is not None else "-"
+        print(
+            f"{codec_name:>6}: {result['kbit_per_second']:7.1f} kbit/s | "
+            f"decodificación {result['decode_cpu_ms_per_audio_second']:6.2f} ms CPU/s audio | "
+            f"SNR {result['snr_db']:5.1f} dB | WER {wer}"
+        )
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Compara los motores de transcripción reproduciendo grabaciones de 16 kHz por
+el mismo camino que un dispositivo real: cada grabación se envía por un
+socket a `main.handle_client_connection` en tramas AUDIO del tamaño del
+firmware, a ritmo de tiempo real, y termina con una trama END. El popup se
+sustituye por uno falso que anota cuándo llega cada parcial y cada final.
+
+Por motor informa: tiempo hasta el primer parcial, latencia del final tras
+END, factor de tiempo real de CPU (`cpu_rtf`: tiempo de CPU del proceso entre
+duración del audio, no tiempo de reloj), CPU, RSS y WER.
+
+El VAD del servidor está desactivado por defecto: con él, el final suele
+llegar por silencio antes de END y no mide la latencia tras END. Con `--vad`
+se activa; los finales que llegan antes de END no cuentan para la latencia.
+
+Con `--assistant openai/whisper-tiny` el motor `whisper` se mide además con
+decodificación especulativa (ese modelo como borrador) para compararlo con
+`generate` normal: misma latencia de final y `cpu_rtf`, y el WER debería coincidir.
+
+Uso:
+    python bench_engines.py grabaciones/ [--engines vosk faster-whisper]
+                                         [--speed 1.0] [--vad] [--json motores.json]
+                                         [--assistant openai/whisper-tiny]
+
+Si junto a `x.wav` existe `x.txt` se usa como referencia para el WER.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import resource
+import socket
+import statistics
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import escritor as esc
+import main
+import protocol
+from bench_codec import load_recordings
+from utils import word_error_rate
+
+SAMPLE_RATE = 16000
+# Mismo bloque que el firmware: 1024 muestras (2048 bytes) por i2s_read.
+CHUNK_BYTES = 2048
+
+
+class ImmediateGLib:
+    """Sustituye a GLib: ejecuta en el acto lo que main.py encola con idle_add."""
+
+    @staticmethod
+    def idle_add(function, *args):
+        function(*args)
+        return False
+
+
+class FakePopup:
+    """Popup sin interfaz que registra cuándo se muestra cada texto."""
+
+    def __init__(self):
+        self.visible = False
+        self.partials = []
+        self.finals = []
+
+    def is_visible(self) -> bool:
+        return self.visible
+
+    def show_all(self):
+        self.visible = True
+
+    def hide(self):
+        self.visible = False
+
+    def hide_for(self, owner):
+        self.hide()
+
+    def set_position_from_cursor(self):
+        pass
+
+    def update_text(self, text: str, owner=None):
+        if text != "Escuchando...":
+            self.partials.append((time.perf_counter(), text))
+
+    def show_final_result(self, text: str, owner=None, timeout=None):
+        self.finals.append((time.perf_counter(), text))
+
+
+def replay(engine: esc.TranscriptionEngine, pcm: bytes, speed: float) -> dict:
+    """Envía una grabación por un socket como lo haría el firmware."""
+    popup_window = FakePopup()
+    client, server = socket.socketpair()
+    session = threading.Thread(
+        target=main.handle_client_connection,
+        args=(server, "bench", popup_window, engine),
+    )
+    cpu_start = time.process_time()
+    session.start()
+
+    client.sendall(protocol.encode_header(SAMPLE_RATE))
+    start = time.perf_counter()
+    for offset in range(0, len(pcm), CHUNK_BYTES):
+        if speed > 0:
+            # Calendario absoluto para que los retrasos no se acumulen.
+            delay = start + offset / 2 / SAMPLE_RATE / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        client.sendall(
+            protocol.encode_frame(protocol.AUDIO, pcm[offset : offset + CHUNK_BYTES])
+        )
+    client.sendall(protocol.encode_frame(protocol.END))
+    end_sent = time.perf_counter()
+    # Al cerrar, la sesión termina de procesar su cola (incluido el final).
+    client.shutdown(socket.SHUT_WR)
+    session.join()
+    client.close()
+    cpu_seconds = time.process_time() - cpu_start
+
+    audio_seconds = len(pcm) / 2 / SAMPLE_RATE
+    first_partial = popup_window.partials[0][0] if popup_window.partials else None
+    last_final = popup_window.finals[-1][0] if popup_window.finals else None
+    return {
+        "audio_s": audio_seconds,
+        "ttfp_ms": (first_partial - start) * 1000 if first_partial else None,
+        # Un final anterior a END (cerrado por el VAD) no es latencia tras END.
+        "final_latency_ms": (
+            (last_final - end_sent) * 1000
+            if last_final is not None and last_final >= end_sent
+            else None
+        ),
+        "cpu_s": cpu_seconds,
+        "cpu_rtf": cpu_seconds / audio_seconds,
+        "partials": len(popup_window.partials),
+        "text": " ".join(text for _, text in popup_window.finals),
+    }
+
+
+def median(values: list) -> float | None:
+    values = [v for v in values if v is not None]
+    return statistics.median(values) if values else None
+
+
+def benchmark_engine(
+    name: str,
+    recordings: list,
+    speed: float,
+    vad: bool,
+    verbose: bool,
+    assistant: str | None = None,
+) -> dict:
+    """Mide un motor. Se ejecuta en un proceso propio para que la CPU y el RSS
+    de un motor no se mezclen con los del anterior."""
+    main.GLib = ImmediateGLib()
+    main.VAD_ENABLED = vad
+    main.ENGINE_CHOICE = name
+    main.WHISPER_ASSISTANT_MODEL = assistant
+    server_log = io.StringIO()
+    with contextlib.nullcontext() if verbose else contextlib.redirect_stdout(server_log):
+        load_start = time.perf_counter()
+        engine = main.build_engine()
+        engine.warm_up()
+        load_seconds = time.perf_counter() - load_start
+
+        runs = []
+        for recording_name, pcm, reference in recordings:
+            run = replay(engine, pcm, speed)
+            run["recording"] = recording_name
+            run["wer"] = (
+                word_error_rate(reference, run["text"]) if reference is not None else None
+            )
+            runs.append(run)
+
+    wers = [run["wer"] for run in runs if run["wer"] is not None]
+    return {
+        "engine": name,
+        "assistant": assistant,
+        "load_s": load_seconds,
+        "ttfp_ms": median([run["ttfp_ms"] for run in runs]),
+        "final_latency_ms": median([run["final_latency_ms"] for run in runs]),
+        "cpu_rtf": sum(run["cpu_s"] for run in runs) / sum(run["audio_s"] for run in runs),
+        "cpu_s": sum(run["cpu_s"] for run in runs),
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "wer": statistics.mean(wers) if wers else None,
+        "runs": runs,
+    }
+
+
+def format_ms(value: float | None) -> str:
+    return f"{value:7.0f} ms" if value is not None else "      - ms"
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("directory")
+    parser.add_argument(
+        "--engines", nargs="+", choices=list(esc.ENGINES), default=list(esc.ENGINES)
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="Velocidad de envío respecto al tiempo real (0 = sin pausas).",
+    )
+    parser.add_argument(
+        "--vad",
+        action="store_true",
+        help="Activa el VAD del servidor (los finales anteriores a END no miden latencia).",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Muestra los logs del servidor.")
+    parser.add_argument(
+        "--assistant",
+        help="Modelo borrador para medir también `whisper` con decodificación especulativa.",
+    )
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    recordings = load_recordings(args.directory)
+    if not recordings:
+        parser.error(f"No hay grabaciones .wav/.pcm en '{args.directory}'.")
+
+    runs = [(name, None) for name in args.engines]
+    if args.assistant and "whisper" in args.engines:
+        runs.append(("whisper", args.assistant))
+
+    results = []
+    spawn = multiprocessing.get_context("spawn")
+    for name, assistant in runs:
+        label = f"{name}+borrador" if assistant else name
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+            future = executor.submit(
+                benchmark_engine,
+                name,
+                recordings,
+                args.speed,
+                args.vad,
+                args.verbose,
+                assistant,
+            )
+            try:
+                result = future.result()
+            except RuntimeError as e:
+                print(f"{label:>15}: no disponible ({e})")
+                continue
+        results.append(result)
+        wer = f"{result['wer']:.3f}" if result["wer"] is not None else "-"
+        print(
+            f"{label:>15}: primer parcial {format_ms(result['ttfp_ms'])} | "
+            f"final tras END {format_ms(result['final_latency_ms'])} | "
+            f"RTF de CPU {result['cpu_rtf']:.2f} | RSS {result['max_rss_mb']:.0f} MB | WER {wer}"
+        )
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main_cli()
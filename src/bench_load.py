@@ -0,0 +1,366 @@
+"""
+Generador de carga: simula N dispositivos Atom Echo conectados a la vez al
+servidor (puerto 8888) para dimensionarlo. Cada dispositivo reproduce
+grabaciones de 16 kHz como el firmware: bloques de 1024 muestras a ritmo de
+tiempo real con algo de jitter, pausas de push-to-talk entre elocuciones y
+una trama END (o "[END]") al soltar el botón. No necesita sounddevice ni GTK.
+
+Con el protocolo enmarcado cada dispositivo pide los textos al servidor
+(CONFIG {"results": true}) y envía un PING por segundo. Por sesión mide:
+espera hasta ser atendido, tiempo hasta el primer parcial, latencia del final
+tras END, RTT de PING, parciales tardíos, finales perdidos y bloques de audio
+que salieron tarde porque el servidor no leía (backpressure).
+
+Uso:
+    python bench_load.py grabaciones/ --devices 8 [--host 127.0.0.1] [--port 8888]
+                         [--utterances 5] [--codec pcm] [--ramp] [--json carga.json]
+
+Con --ramp se prueba con 1, 2, 4, ... hasta --devices dispositivos y se indica
+a partir de cuántos el servidor se satura (p95 del final por encima de
+--slo-ms, finales perdidos o audio retenido).
+"""
+
+import argparse
+import json
+import random
+import socket
+import struct
+import threading
+import time
+
+import audio_codec
+import protocol
+from bench_codec import load_recordings
+
+SAMPLE_RATE = 16000
+# Mismo bloque que el firmware: 1024 muestras (2048 bytes) por i2s_read.
+CHUNK_BYTES = 2048
+CHUNK_SECONDS = CHUNK_BYTES / 2 / SAMPLE_RATE
+# Con el botón suelto el firmware comprueba el botón cada 50 ms.
+BUTTON_POLL_SECONDS = 0.05
+PING_INTERVAL = 1.0
+PING_PAYLOAD = struct.Struct("<d")
+
+
+def percentile(values: list, q: float) -> float | None:
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class SimulatedDevice:
+    """Un Atom Echo: una conexión persistente y varias pulsaciones del botón."""
+
+    def __init__(self, device_id: int, recordings: list, options):
+        self.device_id = device_id
+        self.recordings = recordings
+        self.options = options
+        self.random = random.Random(options.seed + device_id)
+        self.legacy = options.legacy
+        self.sock = None
+        self.send_lock = threading.Lock()
+        self.condition = threading.Condition()
+        self.partials = []
+        self.finals = []
+        self.ping_rtts = []
+        self.statuses = []
+        self.ready_s = None
+        self.connected_at = None
+
+    def run(self, start_delay: float) -> dict:
+        time.sleep(start_delay)
+        result = {"device": self.device_id, "error": None, "utterances": []}
+        try:
+            self.sock = socket.create_connection(
+                (self.options.host, self.options.port), timeout=10.0
+            )
+            self.sock.settimeout(None)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.connected_at = time.perf_counter()
+            codec = audio_codec.CODEC_NAMES[self.options.codec]
+            encoder = None
+            if not self.legacy:
+                self.sock.sendall(protocol.encode_header(SAMPLE_RATE, codec=codec))
+                self.sock.sendall(protocol.encode_config({"results": True}))
+                if codec != protocol.CODEC_PCM16:
+                    encoder = audio_codec.create_encoder(codec, SAMPLE_RATE)
+                threading.Thread(target=self._receive, daemon=True).start()
+                threading.Thread(target=self._ping, daemon=True).start()
+
+            for index in range(self.options.utterances):
+                name, pcm, _ = self.recordings[
+                    (self.device_id + index) % len(self.recordings)
+                ]
+                utterance = self._speak(pcm, encoder)
+                utterance["recording"] = name
+                result["utterances"].append(utterance)
+        except OSError as e:
+            result["error"] = str(e)
+        finally:
+            if self.sock is not None:
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                self.sock.close()
+
+        result["ready_ms"] = self.ready_s * 1000 if self.ready_s is not None else None
+        result["ping_rtt_ms"] = [rtt * 1000 for rtt in self.ping_rtts]
+        result["statuses"] = self.statuses
+        return result
+
+    def _send(self, data: bytes):
+        with self.send_lock:
+            self.sock.sendall(data)
+
+    def _send_audio(self, chunk: bytes, encoder):
+        if self.legacy:
+            self._send(chunk)
+        elif encoder is not None:
+            for packet in encoder.encode(chunk):
+                self._send(protocol.encode_frame(protocol.AUDIO, packet))
+        else:
+            self._send(protocol.encode_frame(protocol.AUDIO, chunk))
+
+    def _speak(self, pcm: bytes, encoder) -> dict:
+        """Una pulsación: audio a ritmo de i2s_read, END y espera del final."""
+        time.sleep(self.random.uniform(0, BUTTON_POLL_SECONDS))
+        with self.condition:
+            first_partial = len(self.partials)
+            first_final = len(self.finals)
+
+        start = time.perf_counter()
+        late_chunks = 0
+        max_lag = 0.0
+        jitter = self.options.jitter_ms / 1000
+        for index, offset in enumerate(range(0, len(pcm), CHUNK_BYTES)):
+            # Calendario absoluto: el jitter retrasa un bloque, no los siguientes.
+            scheduled = start + (index + 1) * CHUNK_SECONDS / self.options.speed
+            delay = scheduled + abs(self.random.gauss(0, jitter)) - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self._send_audio(pcm[offset : offset + CHUNK_BYTES], encoder)
+            lag = time.perf_counter() - scheduled
+            max_lag = max(max_lag, lag)
+            if lag > CHUNK_SECONDS + jitter * 3:
+                late_chunks += 1
+
+        self._send(
+            protocol.LEGACY_END_MARKER
+            if self.legacy
+            else protocol.encode_frame(protocol.END)
+        )
+        end_sent = time.perf_counter()
+
+        closed_at = None
+        if not self.legacy:
+            with self.condition:
+                # El servidor responde cada END con un FINAL (vacío si el VAD
+                # ya había cerrado la elocución).
+                self.condition.wait_for(
+                    lambda: any(t >= end_sent for t, _ in self.finals[first_final:]),
+                    timeout=self.options.final_timeout,
+                )
+                finals = list(self.finals[first_final:])
+                partials = list(self.partials[first_partial:])
+            closed_at = next((t for t, _ in finals if t >= end_sent), None)
+            if closed_at is not None:
+                finals = [(t, text) for t, text in finals if t <= closed_at]
+        else:
+            finals, partials = [], []
+
+        texts = [(t, text) for t, text in finals if text]
+        last_text = texts[-1][0] if texts else closed_at
+        gaps = [b - a for a, b in zip([start] + partials, partials)]
+
+        # Pausa de push-to-talk contada desde que se soltó el botón.
+        gap = self.random.uniform(0.5, 1.5) * self.options.gap
+        remaining = end_sent + gap - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+
+        return {
+            "audio_s": len(pcm) / 2 / SAMPLE_RATE,
+            "ttfp_ms": (partials[0] - start) * 1000 if partials else None,
+            "final_latency_ms": (
+                max(0.0, last_text - end_sent) * 1000 if last_text is not None else None
+            ),
+            "final_lost": not self.legacy and closed_at is None,
+            "partials": len(partials),
+            "late_partials": sum(g * 1000 > self.options.late_ms for g in gaps),
+            "late_chunks": late_chunks,
+            "max_send_lag_ms": max_lag * 1000,
+            "text": " ".join(text for _, text in texts),
+        }
+
+    def _ping(self):
+        try:
+            while True:
+                self._send(
+                    protocol.encode_frame(
+                        protocol.PING, PING_PAYLOAD.pack(time.perf_counter())
+                    )
+                )
+                time.sleep(PING_INTERVAL)
+        except OSError:
+            pass
+
+    def _receive(self):
+        reader = protocol.StreamReader(4096, framed=True)
+        try:
+            while reader.read(self.sock):
+                for frame_type, payload in reader.events():
+                    self._on_frame(frame_type, payload, time.perf_counter())
+        except (OSError, protocol.ProtocolError):
+            pass
+
+    def _on_frame(self, frame_type: int, payload, now: float):
+        with self.condition:
+            if frame_type == protocol.PING:
+                (sent,) = PING_PAYLOAD.unpack(payload)
+                self.ping_rtts.append(now - sent)
+                if self.ready_s is None:
+                    # La primera respuesta llega cuando la sesión ya tiene motor.
+                    self.ready_s = now - self.connected_at
+            elif frame_type == protocol.STATUS:
+                self.statuses.append(bytes(payload).decode("utf-8"))
+            elif frame_type == protocol.PARTIAL:
+                self.partials.append(now)
+            elif frame_type == protocol.FINAL:
+                self.finals.append((now, bytes(payload).decode("utf-8")))
+                self.condition.notify_all()
+
+
+def run_level(devices: int, recordings: list, options) -> dict:
+    """Lanza `devices` dispositivos a la vez y agrega sus métricas."""
+    results = [None] * devices
+
+    def run_device(device_id: int):
+        device = SimulatedDevice(device_id, recordings, options)
+        # Los dispositivos reales no pulsan el botón sincronizados.
+        start_delay = device.random.uniform(0, options.gap)
+        results[device_id] = device.run(start_delay)
+
+    threads = [
+        threading.Thread(target=run_device, args=(i,), daemon=True)
+        for i in range(devices)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    utterances = [u for r in results for u in r["utterances"]]
+
+    def summary(values: list) -> dict:
+        return {f"p{q}": percentile(values, q) for q in (50, 95, 99)}
+
+    level = {
+        "devices": devices,
+        "errors": [r["error"] for r in results if r["error"]],
+        "utterances": len(utterances),
+        "final_latency_ms": summary([u["final_latency_ms"] for u in utterances]),
+        "ttfp_ms": summary([u["ttfp_ms"] for u in utterances]),
+        "ready_ms": summary([r["ready_ms"] for r in results]),
+        "ping_rtt_ms": summary([rtt for r in results for rtt in r["ping_rtt_ms"]]),
+        "partials": sum(u["partials"] for u in utterances),
+        "late_partials": sum(u["late_partials"] for u in utterances),
+        "lost_finals": sum(u["final_lost"] for u in utterances),
+        "late_chunks": sum(u["late_chunks"] for u in utterances),
+        "sessions": results,
+    }
+    p95 = level["final_latency_ms"]["p95"]
+    level["saturated"] = bool(
+        level["errors"]
+        or level["lost_finals"]
+        or level["late_chunks"]
+        or (p95 is not None and p95 > options.slo_ms)
+    )
+    return level
+
+
+def format_ms(value: float | None) -> str:
+    return f"{value:6.0f}" if value is not None else "     -"
+
+
+def print_level(level: dict):
+    final = level["final_latency_ms"]
+    print(
+        f"{level['devices']:>3} disp.: final tras END p50/p95/p99 "
+        f"{format_ms(final['p50'])}/{format_ms(final['p95'])}/{format_ms(final['p99'])} ms | "
+        f"primer parcial p95 {format_ms(level['ttfp_ms']['p95'])} ms | "
+        f"PING p95 {format_ms(level['ping_rtt_ms']['p95'])} ms | "
+        f"atendido p95 {format_ms(level['ready_ms']['p95'])} ms"
+    )
+    print(
+        f"      parciales tardíos {level['late_partials']}/{level['partials']} | "
+        f"finales perdidos {level['lost_finals']}/{level['utterances']} | "
+        f"bloques retenidos {level['late_chunks']} | "
+        f"errores de conexión {len(level['errors'])}"
+        + (" | SATURADO" if level["saturated"] else "")
+    )
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("directory")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8888)
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--utterances", type=int, default=5, help="Pulsaciones por dispositivo.")
+    parser.add_argument("--codec", choices=list(audio_codec.CODEC_NAMES), default="pcm")
+    parser.add_argument(
+        "--legacy", action="store_true", help='PCM crudo y "[END]" (sin textos ni PING).'
+    )
+    parser.add_argument("--gap", type=float, default=2.0, help="Pausa media entre pulsaciones (s).")
+    parser.add_argument("--jitter-ms", type=float, default=5.0, help="Jitter de envío (WiFi).")
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="Velocidad de envío respecto al tiempo real."
+    )
+    parser.add_argument(
+        "--late-ms", type=float, default=1500.0, help="Hueco entre parciales que cuenta como tardío."
+    )
+    parser.add_argument("--final-timeout", type=float, default=30.0)
+    parser.add_argument(
+        "--slo-ms", type=float, default=1000.0, help="p95 del final tras END aceptable."
+    )
+    parser.add_argument("--ramp", action="store_true", help="Prueba 1, 2, 4, ... dispositivos.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+    if args.speed <= 0:
+        parser.error("--speed debe ser mayor que 0.")
+
+    recordings = load_recordings(args.directory)
+    if not recordings:
+        parser.error(f"No hay grabaciones .wav/.pcm en '{args.directory}'.")
+
+    levels = [args.devices]
+    if args.ramp:
+        levels = [n for n in (2**i for i in range(args.devices.bit_length())) if n < args.devices]
+        levels.append(args.devices)
+
+    results = []
+    for devices in levels:
+        level = run_level(devices, recordings, args)
+        results.append(level)
+        print_level(level)
+
+    if args.ramp:
+        saturated = next((level["devices"] for level in results if level["saturated"]), None)
+        if saturated is None:
+            print(f"Sin saturación hasta {args.devices} dispositivos.")
+        else:
+            print(f"El servidor se satura a partir de {saturated} dispositivos.")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,93 @@
+"""
+Mide el arranque en frío del servidor: desde que se lanza el intérprete hasta
+el primer `listen()` y hasta que el motor está cargado y calentado,
+desglosado en importación de `main`, apertura del socket y carga del motor.
+Cada repetición es un proceso nuevo.
+
+Uso:
+    python bench_startup.py [--engine vosk] [--runs 5] [--json arranque.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+CHILD_CODE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+if {engine!r}:
+    main.ENGINE_CHOICE = {engine!r}
+server = main.open_server_socket("127.0.0.1", 0)
+listening = time.perf_counter()
+engine_pool = main.EnginePool(main.build_engine, main.MAX_SESSIONS)
+engine_pool.load(warm_up=main.WARMUP_ENABLED)
+ready = time.perf_counter()
+server.close()
+print(json.dumps({{
+    "import_s": imported - start,
+    "listen_s": listening - imported,
+    "ready_s": ready - listening,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy_modules": [m for m in ("torch", "transformers", "faster_whisper",
+                                  "ctranslate2", "vosk", "numba") if m in sys.modules],
+}}))
+"""
+
+
+def run_once(engine: str | None) -> dict:
+    source_dir = os.path.dirname(os.path.abspath(__file__))
+    spawned = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE.format(engine=engine)],
+        cwd=source_dir,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    measurement = json.loads(result.stdout.strip().splitlines()[-1])
+    measurement["total_s"] = time.perf_counter() - spawned
+    return measurement
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--engine", help="Sobrescribe ENGINE_CHOICE de main.py.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    runs = []
+    for i in range(args.runs):
+        try:
+            runs.append(run_once(args.engine))
+        except subprocess.CalledProcessError as e:
+            print(f"La ejecución {i + 1} falló:\n{e.stderr}")
+            sys.exit(1)
+
+    summary = {
+        key: statistics.median(run[key] for run in runs)
+        for key in ("total_s", "import_s", "listen_s", "ready_s", "max_rss_mb")
+    }
+    summary["heavy_modules"] = runs[-1]["heavy_modules"]
+    summary["runs"] = runs
+
+    print(
+        f"Arranque (mediana de {args.runs}): total {summary['total_s']:.2f} s | "
+        f"import {summary['import_s']:.2f} s | listen {summary['listen_s'] * 1000:.1f} ms | "
+        f"motor listo {summary['ready_s']:.2f} s | RSS {summary['max_rss_mb']:.0f} MB"
+    )
+    print(f"Módulos pesados cargados: {', '.join(summary['heavy_modules']) or 'ninguno'}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
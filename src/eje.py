@@ -1,3 +1,7 @@
+import difflib
+import queue
+import re
+
 import numpy as np
 import torch
 import sounddevice as sd
@@ -11,7 +15,6 @@ from transformers import (
     WhisperForConditionalGeneration,
     WhisperFeatureExtractor,
 )
-import collections
 
 BLOCK_SIZE = 4096
 MODEL_NAME = "distil-whisper/distil-large-v3"
@@ -24,10 +27,118 @@ MIN_CHUNK_SECONDS = 5
 MAX_CHUNK_SECONDS = 25
 SILENCE_THRESHOLD = 0.02
 SILENCE_SECONDS = 0.7
+ENERGY_FRAME_SECONDS = 0.1
+OVERLAP_SECONDS = 0.5
+ASR_BATCH_SIZE = 4
+MERGE_WINDOW_WORDS = 8
 
 print(f"Usando dispositivo: {DEVICE}")
 
-shared_audio_buffer = collections.deque()
+
+class AudioRing:
+    """
+    Buffer de audio preasignado con la energía de cada trama de 100 ms.
+
+    `append` guarda las muestras y la suma de cuadrados de las tramas que
+    completa, acumulada (`cumulative[k]` = energía de las tramas `[0, k)`),
+    así la energía de cualquier ventana es una resta. `consume` avanza el
+    inicio sin mover datos; sólo cuando la escritura llega al final se copia
+    lo pendiente al principio (o a un array el doble de grande), de modo que
+    cada muestra cuesta O(1) amortizado.
+    """
+
+    def __init__(self, capacity: int, frame_size: int):
+        self.frame_size = frame_size
+        self.samples = np.empty(capacity, dtype=np.float32)
+        self.cumulative = np.zeros(capacity // frame_size + 1, dtype=np.float64)
+        self.start = 0
+        self.end = 0
+        # Tramas completas a partir de `start` y ventanas ya revisadas.
+        self.frames = 0
+        self.searched = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    def _make_room(self, count: int):
+        pending = len(self)
+        first = self.start // self.frame_size
+        samples, cumulative = self.samples, self.cumulative
+        if pending + count > len(samples) // 2:
+            capacity = max(2 * len(samples), 2 * (pending + count))
+            samples = np.empty(capacity, dtype=np.float32)
+            cumulative = np.zeros(capacity // self.frame_size + 1, dtype=np.float64)
+        samples[:pending] = self.samples[self.start : self.end]
+        cumulative[: self.frames + 1] = (
+            self.cumulative[first : first + self.frames + 1] - self.cumulative[first]
+        )
+        self.samples, self.cumulative = samples, cumulative
+        self.start, self.end = 0, pending
+
+    def append(self, block: np.ndarray):
+        block = block.reshape(-1)
+        if self.end + len(block) > len(self.samples):
+            self._make_room(len(block))
+        self.samples[self.end : self.end + len(block)] = block
+        self.end += len(block)
+        first = self.start // self.frame_size + self.frames
+        last = self.start // self.frame_size + len(self) // self.frame_size
+        if last > first:
+            frames = self.samples[
+                first * self.frame_size : last * self.frame_size
+            ].reshape(-1, self.frame_size)
+            energy = np.einsum("ij,ij->i", frames, frames, dtype=np.float64)
+            np.cumsum(energy, out=self.cumulative[first + 1 : last + 1])
+            self.cumulative[first + 1 : last + 1] += self.cumulative[first]
+            self.frames = last - self.start // self.frame_size
+
+    def consume(self, count: int):
+        """Descarta `count` muestras del principio."""
+        count = min(count, len(self))
+        if count % self.frame_size:
+            # Corte fuera de trama: se recalculan las energías de lo que queda.
+            pending = self.samples[self.start + count : self.end].copy()
+            self.clear()
+            self.append(pending)
+            return
+        self.start += count
+        self.frames -= count // self.frame_size
+        self.searched = 0
+
+    def clear(self):
+        self.start = self.end = 0
+        self.frames = self.searched = 0
+
+    def read(self, count: int | None = None) -> np.ndarray:
+        """Copia de las primeras `count` muestras (todas si es None)."""
+        count = len(self) if count is None else min(count, len(self))
+        return self.samples[self.start : self.start + count].copy()
+
+    def find_silence(self, window_frames: int, max_energy: float, min_frames: int):
+        """
+        Fin (en muestras) de la última ventana de `window_frames` tramas con
+        energía menor que `max_energy`, o None. Las ventanas revisadas en
+        llamadas anteriores no se vuelven a mirar: sólo cambian las nuevas.
+        """
+        if self.frames < min_frames:
+            return None
+        first = self.start // self.frame_size
+        # Ventanas que empiezan en la trama i >= 1 y terminan en i + window.
+        low = max(1, self.searched - window_frames + 1)
+        high = self.frames - window_frames
+        self.searched = self.frames
+        if high < low:
+            return None
+        cumulative = self.cumulative[first : first + self.frames + 1]
+        energy = cumulative[low + window_frames : high + window_frames + 1] - cumulative[low : high + 1]
+        silent = np.flatnonzero(energy < max_energy)
+        if not len(silent):
+            return None
+        return (low + silent[-1] + window_frames) * self.frame_size
+
+
+FRAME_SIZE = int(ENERGY_FRAME_SECONDS * SAMPLE_RATE)
+audio_ring = AudioRing(2 * MAX_CHUNK_SECONDS * SAMPLE_RATE, FRAME_SIZE)
 buffer_lock = threading.Lock()
 is_recording = False
 
@@ -38,7 +149,7 @@ def audio_callback(indata, frames, time, status):
         print(status, file=sys.stderr)
     if is_recording:
         with buffer_lock:
-            shared_audio_buffer.append(indata.copy())
+            audio_ring.append(indata)
 
 
 def wait_for_enter(stop_event):
@@ -46,80 +157,153 @@ def wait_for_enter(stop_event):
     stop_event.set()
 
 
+def _normalize(word):
+    return re.sub(r"[^\w]", "", word.lower())
+
+
+def merge_overlap(previous_words, text, window=MERGE_WINDOW_WORDS):
+    """
+    Quita del principio de `text` las palabras que repiten el final del
+    segmento anterior (el audio de solapamiento se transcribe dos veces).
+    Alinea las últimas `window` palabras anteriores con las primeras de
+    `text` y descarta hasta el final del bloque común si éste cierra el
+    segmento anterior.
+    """
+    words = text.split()
+    tail = [_normalize(w) for w in previous_words[-window:]]
+    head = [_normalize(w) for w in words[:window]]
+    if not tail or not head:
+        return words
+    match = difflib.SequenceMatcher(None, tail, head, autojunk=False).find_longest_match(
+        0, len(tail), 0, len(head)
+    )
+    # El bloque común debe tocar el final del anterior y el inicio del nuevo
+    # (admitiendo una palabra mal reconocida en cada borde).
+    if (
+        match.size
+        and match.a + match.size >= len(tail) - 1
+        and match.b <= 1
+        and any(tail[match.a : match.a + match.size])
+    ):
+        return words[match.b + match.size :]
+    return words
+
+
+class TranscriptionWorker(threading.Thread):
+    """
+    Consumidor de segmentos: los transcribe en lotes de hasta
+    `ASR_BATCH_SIZE` (los que se hayan acumulado mientras el modelo estaba
+    ocupado) y los imprime en orden, sin el texto repetido del solapamiento.
+    """
+
+    def __init__(self, asr_pipeline, forced_decoder_ids, batch_size=ASR_BATCH_SIZE):
+        super().__init__(daemon=True)
+        self.asr_pipeline = asr_pipeline
+        self.forced_decoder_ids = forced_decoder_ids
+        self.batch_size = batch_size
+        self.segments = queue.Queue()
+        self.previous_words = []
+
+    def submit(self, audio):
+        self.segments.put(audio)
+
+    def finish(self):
+        self.segments.put(None)
+        self.join()
+
+    def next_batch(self):
+        first = self.segments.get()
+        if first is None:
+            return None, True
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                segment = self.segments.get_nowait()
+            except queue.Empty:
+                break
+            if segment is None:
+                return batch, True
+            batch.append(segment)
+        return batch, False
+
+    def transcribe(self, batch):
+        generate_kwargs = {"forced_decoder_ids": self.forced_decoder_ids}
+        results = self.asr_pipeline(
+            batch, batch_size=len(batch), generate_kwargs=generate_kwargs
+        )
+        for result in results:
+            words = merge_overlap(self.previous_words, result["text"].strip())
+            if words:
+                self.previous_words = words
+                print(f"\n>>> {' '.join(words)}", end="", flush=True)
+
+    def run(self):
+        done = False
+        while not done:
+            batch, done = self.next_batch()
+            if batch:
+                self.transcribe(batch)
+
+
 class TranscriptionThread(threading.Thread):
+    """
+    Productor: corta el audio en segmentos por los silencios y los pasa al
+    `TranscriptionWorker`, sin esperar a que se transcriban. Cada segmento
+    empieza con los últimos `OVERLAP_SECONDS` del anterior para no perder
+    palabras en los cortes forzados.
+    """
+
     def __init__(self, asr_pipeline, forced_decoder_ids, stop_session_event):
         super().__init__()
-        self.asr_pipeline = asr_pipeline
-        self.forced_decoder_ids = forced_decoder_ids
+        self.worker = TranscriptionWorker(asr_pipeline, forced_decoder_ids)
         self.stop_session_event = stop_session_event
+        self.overlap = int(OVERLAP_SECONDS / ENERGY_FRAME_SECONDS) * FRAME_SIZE
+        self.carried = 0
 
-    def get_full_buffer(self):
+    def buffer_length(self):
         with buffer_lock:
-            if not shared_audio_buffer:
-                return np.array([], dtype=np.float32)
-            return np.concatenate(list(shared_audio_buffer), axis=0).flatten()
-
-    def find_split_point(self, audio_data):
-        samples_per_second = SAMPLE_RATE
-        silence_samples = int(SILENCE_SECONDS * samples_per_second)
-        chunk_size = int(0.1 * samples_per_second)
-        num_chunks = len(audio_data) // chunk_size
-        if num_chunks < 10:
-            return None
-        for i in range(num_chunks - 1, 0, -1):
-            start_index = i * chunk_size
-            end_index = start_index + silence_samples
-            if end_index > len(audio_data):
-                continue
-            segment = audio_data[start_index:end_index]
-            rms = np.sqrt(np.mean(segment**2))
-            if rms < SILENCE_THRESHOLD:
-                return end_index
-        return None
+            return len(audio_ring)
 
-    def process_and_clear_buffer(self, audio_to_process, samples_to_process):
-        generate_kwargs = {"forced_decoder_ids": self.forced_decoder_ids}
-        result = self.asr_pipeline(
-            audio_to_process.copy(), generate_kwargs=generate_kwargs
-        )
-        transcribed_text = result["text"].strip()
-        if transcribed_text:
-            print(f"\n>>> {transcribed_text}", end="", flush=True)
+    def find_split_point(self):
+        # Ventana de SILENCE_SECONDS con RMS < SILENCE_THRESHOLD, en energía.
+        window_frames = max(1, round(SILENCE_SECONDS / ENERGY_FRAME_SECONDS))
+        max_energy = SILENCE_THRESHOLD**2 * window_frames * FRAME_SIZE
+        with buffer_lock:
+            return audio_ring.find_silence(window_frames, max_energy, min_frames=10)
 
+    def cut_segment(self, samples_to_process=None):
         with buffer_lock:
-            num_blocks_to_remove = samples_to_process // BLOCK_SIZE
-            for _ in range(num_blocks_to_remove):
-                if shared_audio_buffer:
-                    shared_audio_buffer.popleft()
-            remaining_samples = samples_to_process % BLOCK_SIZE
-            if remaining_samples > 0 and shared_audio_buffer:
-                first_block = shared_audio_buffer[0]
-                shared_audio_buffer[0] = first_block[remaining_samples:]
+            segment = audio_ring.read(samples_to_process)
+            # Se conserva el solapamiento, alineado a tramas de energía.
+            cut = len(segment) // FRAME_SIZE * FRAME_SIZE
+            self.carried = min(self.overlap, cut)
+            audio_ring.consume(cut - self.carried)
+        self.worker.submit(segment)
 
     def run(self):
         global is_recording
+        self.worker.start()
         while not self.stop_session_event.is_set():
             if not is_recording:
                 time.sleep(0.2)
                 continue
-            audio_data = self.get_full_buffer()
-            buffer_duration = len(audio_data) / SAMPLE_RATE
+            buffer_duration = self.buffer_length() / SAMPLE_RATE
             if buffer_duration < MIN_CHUNK_SECONDS:
                 time.sleep(0.5)
                 continue
-            split_point = self.find_split_point(audio_data)
+            split_point = self.find_split_point()
             if split_point:
-                self.process_and_clear_buffer(audio_data[:split_point], split_point)
+                self.cut_segment(split_point)
             elif buffer_duration > MAX_CHUNK_SECONDS:
                 print("\n[Buffer largo, forzando transcripción...]")
-                self.process_and_clear_buffer(audio_data, len(audio_data))
+                self.cut_segment()
             else:
                 time.sleep(0.5)
-        final_audio = self.get_full_buffer()
-        if len(final_audio) > SAMPLE_RATE:
-            self.process_and_clear_buffer(final_audio, len(final_audio))
+        if self.buffer_length() - self.carried > SAMPLE_RATE:
+            self.cut_segment()
+        self.worker.finish()
         with buffer_lock:
-            shared_audio_buffer.clear()
+            audio_ring.clear()
 
 
 def main():
@@ -1,27 +1,38 @@
+"""
+Motores de transcripción.
+
+Las dependencias pesadas de cada motor (vosk, torch/transformers,
+faster-whisper) se importan al construirlo, no al importar este módulo: un
+despliegue que sólo usa Vosk no carga torch ni falla si faster-whisper u
+onnxruntime no están instalados. Usa `create_engine()` para construir un motor por nombre.
+"""
+
 from abc import ABC, abstractmethod
+import copy
 import json
+import os
+import queue
+import threading
+from concurrent.futures import Future
 import numpy as np
-from faster_whisper import WhisperModel
-import torch
 import time
 
-try:
-    from vosk import Model, KaldiRecognizer
-except ImportError:
-    print(
-        "Advertencia: No se encontró la librería 'vosk'. El motor Vosk no estará disponible."
-    )
-try:
-    import torch
-    import whisper
-except ImportError:
-    print(
-        "Advertencia: No se encontró 'torch' o 'whisper'. El motor Whisper no estará disponible."
-    )
+import metrics
+import profiler
+from features import IncrementalLogMel
+from model_cache import ModelCache
+from resources import UNMANAGED, ExecutionResources
 
 
 class TranscriptionEngine(ABC):
-    """Clase base abstracta para todos los motores de transcripción."""
+    """
+    Clase base abstracta para todos los motores de transcripción.
+
+    Cada llamada que ejecuta el modelo pasa por `self.resources.slot()`, que
+    limita cuántas decodificaciones corren a la vez (ver `resources.py`).
+    """
+
+    resources: ExecutionResources = UNMANAGED
 
     @abstractmethod
     def __init__(self):
@@ -47,60 +58,288 @@ class TranscriptionEngine(ABC):
         """Resetea el estado del motor para una nueva elocución."""
         pass
 
+    @abstractmethod
+    def new_session(self) -> "TranscriptionEngine":
+        """
+        Devuelve un motor con estado propio que comparte el modelo ya cargado.
+        Permite atender varias sesiones sin volver a cargar los pesos.
+        """
+        pass
+
+    def warm_up(self, seconds: float = 1.0):
+        """
+        Decodifica silencio sintético en una sesión desechable para pagar
+        antes de la primera petición real los costes de la primera llamada
+        (JIT, reserva de memoria, cachés de kernels).
+        """
+        session = self.new_session()
+        sample_rate = int(getattr(self, "sample_rate", 16000))
+        session.accept_waveform(bytes(int(sample_rate * seconds) * 2))
+        session.get_partial_result()
+        session.get_final_result()
+        session.reset()
+
 
 class VoskEngine(TranscriptionEngine):
     """Motor de transcripción que utiliza Vosk."""
 
-    def __init__(self, model_path: str, sample_rate: float):
+    def __init__(
+        self,
+        model_path: str,
+        sample_rate: float,
+        resources: ExecutionResources | None = None,
+    ):
         super().__init__()
         print("Inicializando motor: Vosk")
+        self.resources = resources or UNMANAGED
+        try:
+            from vosk import Model
+        except ImportError:
+            raise RuntimeError(
+                "No se encontró la librería 'vosk'. El motor Vosk no está disponible."
+            )
+
         try:
-            model = Model(model_path)
-            self.recognizer = KaldiRecognizer(model, sample_rate)
-            self.recognizer.SetWords(True)
+            self.model = Model(model_path)
+            self.sample_rate = sample_rate
+            self.recognizer = self._new_recognizer()
             print("Motor Vosk listo.")
         except Exception as e:
             raise RuntimeError(
                 f"No se pudo cargar el modelo de Vosk desde '{model_path}': {e}"
             )
 
+    def _new_recognizer(self):
+        from vosk import KaldiRecognizer
+
+        recognizer = KaldiRecognizer(self.model, self.sample_rate)
+        recognizer.SetWords(True)
+        return recognizer
+
     def accept_waveform(self, audio_chunk: bytes):
-        return self.recognizer.AcceptWaveform(audio_chunk)
+        # El binding de Vosk (cffi) sólo acepta bytes, no memoryview.
+        if not isinstance(audio_chunk, bytes):
+            audio_chunk = bytes(audio_chunk)
+        with self.resources.slot():
+            return self.recognizer.AcceptWaveform(audio_chunk)
 
     def get_partial_result(self) -> str:
-        partial = json.loads(self.recognizer.PartialResult())
+        with self.resources.slot():
+            partial = json.loads(self.recognizer.PartialResult())
         return partial.get("partial", "")
 
     def get_final_result(self) -> str:
-        final = json.loads(self.recognizer.FinalResult())
+        with self.resources.slot():
+            final = json.loads(self.recognizer.FinalResult())
         return final.get("text", "")
 
     def reset(self):
         self.recognizer.Reset()
 
+    def new_session(self) -> "VoskEngine":
+        session = copy.copy(self)
+        session.recognizer = self._new_recognizer()
+        return session
 
-from pydub import AudioSegment
+
+class WhisperBatcher:
+    """
+    Hilo de inferencia compartido por todas las sesiones de un WhisperEngine.
+    Recoge durante unos milisegundos las peticiones pendientes de cada sesión
+    y las transcribe como un único lote relleno con `generate`/`batch_decode`.
+    Con `assistant_model` (decodificación especulativa) `generate` sólo admite
+    lotes de uno, así que las peticiones del lote se generan una a una.
+    """
+
+    def __init__(
+        self,
+        processor,
+        model,
+        device: str,
+        language: str,
+        sample_rate: int,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        assistant_model=None,
+        resources: ExecutionResources = UNMANAGED,
+    ):
+        self.processor = processor
+        self.model = model
+        self.assistant_model = assistant_model
+        self.resources = resources
+        self.device = device
+        self.language = language
+        self.sample_rate = sample_rate
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def transcribe(
+        self,
+        audio_np: np.ndarray,
+        return_timestamps: bool = False,
+        features: np.ndarray | None = None,
+    ):
+        """
+        Encola el audio y bloquea hasta que su lote termina. Devuelve el texto,
+        o el diccionario de `batch_decode(output_offsets=True)` si se piden
+        marcas de tiempo. Si se pasan `features` (log-mel ya calculado), el
+        procesador no vuelve a calcularlas.
+        """
+        future = Future()
+        self._requests.put((audio_np, features, return_timestamps, future))
+        return future.result()
+
+    def call(self, function):
+        """
+        Ejecuta `function()` en el hilo del lote, fuera de cualquier lote, y
+        devuelve su resultado. Para decodificaciones que no se pueden agrupar
+        (salida del encoder en caché, prefijo forzado).
+        """
+        future = Future()
+        self._requests.put((None, function, None, future))
+        return future.result()
+
+    def _collect_batch(self) -> list:
+        batch = [self._requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            for _, function, return_timestamps, future in batch:
+                if return_timestamps is None:
+                    try:
+                        with self.resources.slot():
+                            future.set_result(function())
+                    except Exception as e:
+                        future.set_exception(e)
+            # `generate` sólo admite una configuración por llamada, así que las
+            # peticiones con y sin marcas de tiempo van en lotes separados.
+            for return_timestamps in (False, True):
+                group = [item for item in batch if item[2] == return_timestamps]
+                if group:
+                    with self.resources.slot():
+                        self._run_group(group, return_timestamps)
+
+    def _run_group(self, group: list, return_timestamps: bool):
+        import torch
+
+        futures = [future for _, _, _, future in group]
+        metrics.BATCH_SIZE.observe(len(group))
+        start = time.perf_counter()
+        try:
+            with profiler.span("feature_extraction"):
+                features = [item_features for _, item_features, _, _ in group]
+                missing = [i for i, item in enumerate(features) if item is None]
+                if missing:
+                    computed = self.processor(
+                        [group[i][0] for i in missing],
+                        sampling_rate=self.sample_rate,
+                        return_tensors="np",
+                    ).input_features
+                    for i, item in zip(missing, computed):
+                        features[i] = item
+                input_features = torch.from_numpy(np.stack(features)).to(self.device)
+
+            with profiler.span("generate"):
+                if self.assistant_model is None:
+                    predicted_ids = [
+                        self.model.generate(
+                            input_features,
+                            language=self.language,
+                            task="transcribe",
+                            return_timestamps=return_timestamps,
+                        )
+                    ]
+                else:
+                    predicted_ids = [
+                        self.model.generate(
+                            row[None],
+                            language=self.language,
+                            task="transcribe",
+                            return_timestamps=return_timestamps,
+                            assistant_model=self.assistant_model,
+                        )
+                        for row in input_features
+                    ]
+
+            with profiler.span("batch_decode"):
+                transcriptions = [
+                    transcription
+                    for ids in predicted_ids
+                    for transcription in self.processor.batch_decode(
+                        ids,
+                        skip_special_tokens=True,
+                        output_offsets=return_timestamps,
+                    )
+                ]
+            metrics.ENGINE_SECONDS.labels("whisper_batch").observe(
+                time.perf_counter() - start
+            )
+            for future, transcription in zip(futures, transcriptions):
+                future.set_result(transcription)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
 
 
 class WhisperEngine(TranscriptionEngine):
     """
     Motor de transcripción que utiliza un modelo Whisper desde Hugging Face,
     corrigiendo la configuración de generación para modelos fine-tuned.
+
+    Con `assistant_model_name` se carga además un Whisper pequeño con el mismo
+    vocabulario (p. ej. `openai/whisper-tiny`) como borrador: `generate`
+    propone varios tokens con él y el modelo principal los verifica en una
+    sola pasada. El texto es el de la búsqueda voraz del modelo principal.
     """
 
     def __init__(
-        self, model_name: str, sample_rate: float, language: str, channels: int = 1
+        self,
+        model_name: str,
+        sample_rate: float,
+        language: str,
+        channels: int = 1,
+        max_batch_size: int = 1,
+        batch_wait_ms: float = 10.0,
+        streaming: bool = False,
+        max_tail_seconds: float = 15.0,
+        cache_dir: str | None = None,
+        incremental_features: bool = True,
+        reuse_partials: bool = False,
+        prefix_margin_tokens: int = 5,
+        partial_interval: float = 0.5,
+        assistant_model_name: str | None = None,
+        resources: ExecutionResources | None = None,
     ):
         super().__init__()
         print(
             f"Inicializando motor: Whisper (HF) con modelo '{model_name}' e idioma '{language}'"
         )
 
-        from transformers import (
-            WhisperForConditionalGeneration,
-            WhisperProcessor,
-            GenerationConfig,
-        )
+        try:
+            import torch
+            from transformers import (
+                WhisperForConditionalGeneration,
+                WhisperProcessor,
+                GenerationConfig,
+            )
+        except ImportError:
+            raise RuntimeError(
+                "No se encontró 'torch' o 'transformers'. El motor Whisper no está disponible."
+            )
 
         device = "cuda" if torch.cuda.is_available() else "cpu"
 
@@ -108,16 +347,30 @@ class WhisperEngine(TranscriptionEngine):
             print(
                 "Advertencia: CUDA no está disponible. Whisper se ejecutará en CPU (más lento)."
             )
+        self.resources = resources or UNMANAGED
+        if device == "cpu":
+            self.resources.configure_torch(torch)
 
         try:
-            self.processor = WhisperProcessor.from_pretrained(model_name)
-            self.model = WhisperForConditionalGeneration.from_pretrained(model_name)
-
-            # Cargamos una configuración moderna desde el modelo base oficial de OpenAI.
-            # (Drazcat/whisper-small-es está basado en openai/whisper-small)
-            generation_config = GenerationConfig.from_pretrained("openai/whisper-small")
-
-            self.model.generation_config = generation_config
+            if cache_dir is not None:
+                # La caché ya guarda la configuración de generación corregida
+                # y los pesos en safetensors: se carga sin tocar la red.
+                model_path = ModelCache(cache_dir).whisper_hf(model_name)
+                self.processor = WhisperProcessor.from_pretrained(
+                    model_path, local_files_only=True
+                )
+                self.model = WhisperForConditionalGeneration.from_pretrained(
+                    model_path, local_files_only=True, low_cpu_mem_usage=True
+                )
+            else:
+                self.processor = WhisperProcessor.from_pretrained(model_name)
+                self.model = WhisperForConditionalGeneration.from_pretrained(model_name)
+
+                # Cargamos una configuración moderna desde el modelo base oficial de OpenAI.
+                # (Drazcat/whisper-small-es está basado en openai/whisper-small)
+                generation_config = GenerationConfig.from_pretrained("openai/whisper-small")
+
+                self.model.generation_config = generation_config
 
             self.model.to(device)
 
@@ -125,6 +378,30 @@ class WhisperEngine(TranscriptionEngine):
             raise RuntimeError(
                 f"No se pudo cargar el modelo '{model_name}' desde Hugging Face: {e}"
             )
+
+        self.assistant_model = None
+        if assistant_model_name:
+            try:
+                if cache_dir is not None:
+                    assistant_path = ModelCache(cache_dir).whisper_hf(assistant_model_name)
+                    self.assistant_model = WhisperForConditionalGeneration.from_pretrained(
+                        assistant_path, local_files_only=True, low_cpu_mem_usage=True
+                    )
+                else:
+                    self.assistant_model = WhisperForConditionalGeneration.from_pretrained(
+                        assistant_model_name
+                    )
+                self.assistant_model.to(device)
+            except Exception as e:
+                raise RuntimeError(
+                    f"No se pudo cargar el modelo borrador '{assistant_model_name}': {e}"
+                )
+            if self.assistant_model.config.vocab_size != self.model.config.vocab_size:
+                raise RuntimeError(
+                    f"El modelo borrador '{assistant_model_name}' no comparte vocabulario "
+                    f"con '{model_name}'."
+                )
+            print(f"Decodificación especulativa con el borrador '{assistant_model_name}'.")
         self.bytes_per_sample = 2
         self.bytes_per_second = sample_rate * self.bytes_per_sample
         self.channels = channels
@@ -140,50 +417,298 @@ class WhisperEngine(TranscriptionEngine):
         self.transcribed_text = ""
         self.last_partial_result = ""
         self.last_partial_time = 0
-        self.seconds_between_partial = 0.5
+        self.seconds_between_partial = partial_interval
+
+        # Modo incremental: texto confirmado + cola de audio sin confirmar.
+        self.streaming = streaming
+        self.max_tail_bytes = int(self.bytes_per_second * max_tail_seconds)
+        self.previous_segments = []
+
+        # Log-mel incremental: cada parcial sólo calcula las tramas nuevas.
+        self.features = None
+        if incremental_features and channels == 1:
+            self.features = IncrementalLogMel.from_processor(self.processor)
+
+        # Reutilización entre parciales: la salida del encoder se guarda
+        # mientras el audio no cambia y la hipótesis anterior (menos sus
+        # últimos tokens) se fuerza como prefijo del decoder.
+        self.reuse_partials = reuse_partials
+        self.prefix_margin_tokens = prefix_margin_tokens
+        self.audio_version = 0
+        self.encoder_cache = None
+        self.previous_tokens = []
+        if reuse_partials:
+            self.prompt_tokens = [self.model.generation_config.decoder_start_token_id] + [
+                token
+                for _, token in self.processor.get_decoder_prompt_ids(
+                    language=language, task="transcribe", no_timestamps=True
+                )
+            ]
+
+        # Con más de una sesión, las peticiones se agrupan en lotes en un hilo
+        # compartido (las sesiones creadas con new_session() usan el mismo).
+        self.batcher = None
+        if max_batch_size > 1:
+            self.batcher = WhisperBatcher(
+                self.processor,
+                self.model,
+                self.device,
+                self.language,
+                self.sample_rate,
+                max_batch_size=max_batch_size,
+                max_wait_ms=batch_wait_ms,
+                assistant_model=self.assistant_model,
+                resources=self.resources,
+            )
         print(f"Motor Whisper (Hugging Face) listo con configuración corregida.")
 
     def accept_waveform(self, audio_chunk: bytes):
         self.audio_buffer.extend(audio_chunk)
+        self.audio_version += 1
+        if self.features is not None:
+            self.features.append_pcm16(audio_chunk)
         return False
 
-    def _transcribe_chunk(self, audio_bytes: bytes) -> str:
-        """Función auxiliar para transcribir un trozo de audio."""
-        if not audio_bytes:
-            return ""
-
-        audio_np = (
-            np.frombuffer(audio_bytes, dtype=np.int16).astype(np.float32) / 32768.0
-        )
+    def _buffer_features(self) -> np.ndarray | None:
+        """Log-mel de `audio_buffer` desde la caché incremental, si es posible."""
+        if self.features is None:
+            return None
+        with profiler.span("feature_extraction"):
+            return self.features.features()
+
+    def _drop_audio(self, byte_count: int):
+        """Descarta audio del inicio del buffer y de la caché de log-mel."""
+        del self.audio_buffer[:byte_count]
+        self.audio_version += 1
+        self.previous_tokens = []
+        if self.features is not None:
+            self.features.drop(byte_count // self.bytes_per_sample)
+
+    def _generate(
+        self,
+        audio_np: np.ndarray,
+        return_timestamps: bool = False,
+        features: np.ndarray | None = None,
+    ):
+        if self.batcher is not None:
+            return self.batcher.transcribe(audio_np, return_timestamps, features)
+        with self.resources.slot():
+            return self._generate_unbatched(audio_np, return_timestamps, features)
+
+    def _generate_unbatched(
+        self,
+        audio_np: np.ndarray,
+        return_timestamps: bool = False,
+        features: np.ndarray | None = None,
+    ):
+        with profiler.span("feature_extraction"):
+            if features is not None:
+                import torch
 
-        try:
-            input_features = self.processor(
-                audio_np, sampling_rate=self.sample_rate, return_tensors="pt"
-            ).input_features.to(self.device)
+                input_features = torch.from_numpy(features[None]).to(self.device)
+            else:
+                input_features = self.processor(
+                    audio_np, sampling_rate=self.sample_rate, return_tensors="pt"
+                ).input_features.to(self.device)
 
+        with profiler.span("generate"):
             predicted_ids = self.model.generate(
-                input_features, language=self.language, task="transcribe"
+                input_features,
+                language=self.language,
+                task="transcribe",
+                return_timestamps=return_timestamps,
+                assistant_model=self.assistant_model,
             )
 
+        with profiler.span("batch_decode"):
             transcription = self.processor.batch_decode(
-                predicted_ids, skip_special_tokens=True
+                predicted_ids, skip_special_tokens=True, output_offsets=return_timestamps
             )
-            return transcription[0].strip() if transcription else ""
+        return transcription[0]
+
+    def _decode_reusing(
+        self, audio_np: np.ndarray | None, features: np.ndarray | None, prefix: list
+    ) -> tuple[str, list]:
+        """
+        Decodifica el buffer actual reutilizando la salida del encoder si el
+        audio no ha cambiado desde la última llamada, y forzando `prefix` como
+        inicio del texto: `generate` procesa el prefijo en una sola pasada en
+        lugar de generarlo token a token. Devuelve el texto y sus tokens.
+        """
+        import torch
+        from transformers.modeling_outputs import BaseModelOutput
+
+        if self.encoder_cache is None or self.encoder_cache[0] != self.audio_version:
+            with profiler.span("feature_extraction"):
+                if features is not None:
+                    input_features = torch.from_numpy(features[None])
+                else:
+                    input_features = self.processor(
+                        audio_np, sampling_rate=self.sample_rate, return_tensors="pt"
+                    ).input_features
+            input_features = input_features.to(self.device)
+            with profiler.span("encoder"), torch.no_grad():
+                hidden_states = self.model.get_encoder()(input_features).last_hidden_state
+                # El borrador tiene su propio encoder: también se guarda.
+                assistant_states = None
+                if self.assistant_model is not None:
+                    assistant_states = self.assistant_model.get_encoder()(
+                        input_features
+                    ).last_hidden_state
+            self.encoder_cache = (self.audio_version, hidden_states, assistant_states)
+
+        _, hidden_states, assistant_states = self.encoder_cache
+        assistant_kwargs = {}
+        if self.assistant_model is not None:
+            assistant_kwargs = dict(
+                assistant_model=self.assistant_model,
+                assistant_encoder_outputs=BaseModelOutput(last_hidden_state=assistant_states),
+            )
+        decoder_input_ids = torch.tensor([self.prompt_tokens + prefix], device=self.device)
+        with profiler.span("generate"):
+            predicted_ids = self.model.generate(
+                encoder_outputs=BaseModelOutput(last_hidden_state=hidden_states),
+                decoder_input_ids=decoder_input_ids,
+                language=self.language,
+                task="transcribe",
+                **assistant_kwargs,
+            )
+
+        # `generate` sólo devuelve lo generado tras el prefijo; los ids a
+        # partir de <|endoftext|> son tokens especiales, no texto.
+        end_of_text = self.processor.tokenizer.eos_token_id
+        tokens = prefix + [t for t in predicted_ids[0].tolist() if t < end_of_text]
+        with profiler.span("batch_decode"):
+            text = self.processor.tokenizer.decode(tokens, skip_special_tokens=True)
+        return text.strip(), tokens
+
+    def _transcribe_reusing(self, use_prefix: bool) -> str:
+        if not self.audio_buffer:
+            return ""
+        features = self._buffer_features()
+        audio_np = None
+        if features is None:
+            audio_np = (
+                np.frombuffer(self.audio_buffer, dtype=np.int16).astype(np.float32)
+                / 32768.0
+            )
+        prefix = []
+        if use_prefix and len(self.previous_tokens) > self.prefix_margin_tokens:
+            # Los últimos tokens pueden cambiar con el audio nuevo.
+            prefix = self.previous_tokens[: -self.prefix_margin_tokens]
+            if len(prefix) > self.model.config.max_target_positions // 2:
+                prefix = []
+
+        def decode():
+            return self._decode_reusing(audio_np, features, prefix)
+
+        try:
+            if self.batcher:
+                text, tokens = self.batcher.call(decode)
+            else:
+                with self.resources.slot():
+                    text, tokens = decode()
         except Exception as e:
             print(f"Error durante la transcripción del chunk: {e}")
             return ""
+        if use_prefix:
+            self.previous_tokens = tokens
+        return text
 
-    def get_partial_result(self, skip: bool = False) -> str:
-        if len(self.audio_buffer) < self.sample_rate * 0.5:
+    def _transcribe_chunk(
+        self, audio_bytes: bytes, features: np.ndarray | None = None
+    ) -> str:
+        """Función auxiliar para transcribir un trozo de audio."""
+        if not audio_bytes:
             return ""
 
+        audio_np = None
+        if features is None:
+            audio_np = (
+                np.frombuffer(audio_bytes, dtype=np.int16).astype(np.float32) / 32768.0
+            )
+
+        try:
+            return self._generate(audio_np, features=features).strip()
+        except Exception as e:
+            print(f"Error durante la transcripción del chunk: {e}")
+            return ""
+
+    def _transcribe_segments(
+        self, audio_bytes: bytes, features: np.ndarray | None = None
+    ) -> tuple[str, list]:
         """
-        Procesa el buffer de audio, segmentándolo si es necesario, y devuelve
-        la transcripción parcial acumulada más la del fragmento actual.
+        Transcribe con marcas de tiempo. Devuelve el texto completo y la lista
+        de segmentos cerrados como tuplas (texto, inicio, fin) en segundos.
         """
-        if time.time() - self.last_partial_time < self.seconds_between_partial:
-            return self.last_partial_result
+        if not audio_bytes:
+            return "", []
 
+        audio_np = None
+        if features is None:
+            audio_np = (
+                np.frombuffer(audio_bytes, dtype=np.int16).astype(np.float32) / 32768.0
+            )
+
+        try:
+            output = self._generate(audio_np, return_timestamps=True, features=features)
+            segments = [
+                (offset["text"].strip(), *offset["timestamp"])
+                for offset in output["offsets"]
+            ]
+            return output["text"].strip(), segments
+        except Exception as e:
+            print(f"Error durante la transcripción del chunk: {e}")
+            return "", []
+
+    def _commit_segments(self, segments: list):
+        """Añade los segmentos al texto confirmado y descarta su audio."""
+        end_seconds = segments[-1][2]
+        cut = int(end_seconds * self.sample_rate) * self.bytes_per_sample * self.channels
+        self._drop_audio(min(cut, len(self.audio_buffer)))
+        self.transcribed_text += " ".join(text for text, _, _ in segments) + " "
+
+    def _get_streaming_partial(self) -> str:
+        """
+        Decodificación incremental estilo LocalAgreement: los segmentos que
+        coinciden en dos hipótesis consecutivas se confirman y su audio se
+        descarta, de modo que sólo se vuelve a decodificar la cola.
+        """
+        text, segments = self._transcribe_segments(
+            self.audio_buffer, self._buffer_features()
+        )
+
+        # El último segmento puede estar a medias, nunca se confirma por acuerdo.
+        stable = 0
+        for previous_text, (segment_text, _, _) in zip(
+            self.previous_segments, segments[:-1]
+        ):
+            if previous_text.lower() != segment_text.lower():
+                break
+            stable += 1
+
+        # Si la cola crece demasiado sin acuerdo, se fuerza la confirmación
+        # para que el coste de cada parcial siga acotado.
+        if not stable and len(self.audio_buffer) >= self.max_tail_bytes:
+            stable = len(segments) - 1
+
+        if stable > 0:
+            self._commit_segments(segments[:stable])
+            # El resto de la hipótesis, incluida la cola que aún no cerró
+            # ningún segmento: se quitan del texto las palabras confirmadas.
+            committed_words = sum(len(t.split()) for t, _, _ in segments[:stable])
+            text = " ".join(text.split()[committed_words:])
+            segments = segments[stable:]
+
+        self.previous_segments = [segment_text for segment_text, _, _ in segments]
+        return (self.transcribed_text + text).strip()
+
+    def _commit_chunks(self):
+        """
+        Transcribe y descarta los bloques completos de 30 s del buffer. Whisper
+        sólo ve 30 s por pasada, así que el final también lo llama: si se
+        omitieron los parciales, el buffer puede haber pasado de ese tamaño.
+        """
         while len(self.audio_buffer) >= self.bytes_per_chunk:
             chunk_to_process = self.audio_buffer[: self.bytes_per_chunk]
 
@@ -195,12 +720,33 @@ class WhisperEngine(TranscriptionEngine):
             if transcribed_chunk_text:
                 self.transcribed_text += transcribed_chunk_text + " "
 
-            self.audio_buffer = self.audio_buffer[self.bytes_per_chunk :]
+            self._drop_audio(self.bytes_per_chunk)
+            self.previous_segments = []
             print(f"[Segmentación] Texto acumulado: '{self.transcribed_text[:50]}...'")
 
-        partial_transcription = self._transcribe_chunk(self.audio_buffer)
+    def get_partial_result(self, skip: bool = False) -> str:
+        if len(self.audio_buffer) < self.sample_rate * 0.5:
+            return ""
+
+        """
+        Procesa el buffer de audio, segmentándolo si es necesario, y devuelve
+        la transcripción parcial acumulada más la del fragmento actual.
+        """
+        if time.time() - self.last_partial_time < self.seconds_between_partial:
+            return self.last_partial_result
 
-        full_result = self.transcribed_text + partial_transcription
+        self._commit_chunks()
+
+        if self.streaming:
+            full_result = self._get_streaming_partial()
+        elif self.reuse_partials:
+            partial_transcription = self._transcribe_reusing(use_prefix=True)
+            full_result = self.transcribed_text + partial_transcription
+        else:
+            partial_transcription = self._transcribe_chunk(
+                self.audio_buffer, self._buffer_features()
+            )
+            full_result = self.transcribed_text + partial_transcription
 
         self.last_partial_result = full_result
         self.last_partial_time = time.time()
@@ -212,7 +758,19 @@ class WhisperEngine(TranscriptionEngine):
         Procesa cualquier audio restante en el buffer, lo añade a la transcripción
         y devuelve el texto completo y final.
         """
-        final_text = self._transcribe_chunk(self.audio_buffer)
+        self._commit_chunks()
+        encoder_cached = (
+            self.encoder_cache is not None and self.encoder_cache[0] == self.audio_version
+        )
+        if self.reuse_partials and encoder_cached:
+            # No ha llegado audio desde el último parcial: se reutiliza la
+            # salida del encoder, sin prefijo para no arrastrar sus errores.
+            # Si no, el final va por el camino normal, que se agrupa en lotes.
+            final_text = self._transcribe_reusing(use_prefix=False)
+        else:
+            final_text = self._transcribe_chunk(
+                self.audio_buffer, self._buffer_features()
+            )
 
         self.transcribed_text += final_text
 
@@ -223,32 +781,83 @@ class WhisperEngine(TranscriptionEngine):
 
     def reset(self):
         self.audio_buffer.clear()
+        self.audio_version += 1
+        self.encoder_cache = None
+        self.previous_tokens = []
+        if self.features is not None:
+            self.features.reset()
         self.transcribed_text = ""
         self.last_partial_result = ""
+        self.previous_segments = []
         print("Motor reseteado.")
 
+    def new_session(self) -> "WhisperEngine":
+        session = copy.copy(self)
+        session.audio_buffer = bytearray()
+        if self.features is not None:
+            session.features = self.features.new()
+        session.reset()
+        return session
+
 
 class FasterWhisperEngine(TranscriptionEngine):
     """
     Motor de transcripción que utiliza la implementación optimizada
     de faster-whisper con ctranslate2.
+
+    En modo `streaming` los segmentos ya cerrados (los que terminan antes de
+    los últimos `commit_margin_seconds` del buffer) se confirman y su audio se
+    descarta, por lo que cada parcial sólo decodifica la cola pendiente.
     """
 
-    def __init__(self, model_name: str, sample_rate: float, language: str):
+    def __init__(
+        self,
+        model_name: str,
+        sample_rate: float,
+        language: str,
+        num_workers: int = 1,
+        device: str = "auto",
+        compute_type: str = "int8",
+        beam_size: int = 5,
+        partial_beam_size: int = 1,
+        vad_filter: bool = True,
+        streaming: bool = False,
+        commit_margin_seconds: float = 1.0,
+        cache_dir: str | None = None,
+        resources: ExecutionResources | None = None,
+    ):
         super().__init__()
         print(f"Inicializando motor: FasterWhisper con modelo '{model_name}'")
+        self.resources = resources or UNMANAGED
 
-        device = "cuda"
-        compute_type = "int8"  # faster-whisper no soporta float16 en CPU
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise RuntimeError(
+                "No se encontró 'faster-whisper'. El motor FasterWhisper no está disponible."
+            )
 
         print(f"Usando dispositivo: {device} con tipo de cómputo: {compute_type}")
 
         try:
             print(f"Cargando modelo de FasterWhisper '{model_name}'...")
+            model_path = model_name
+            if cache_dir is not None:
+                # Conversión CTranslate2 hecha una sola vez (admite fine-tunes
+                # de Hugging Face como Drazcat/whisper-small-es).
+                quantization = (
+                    "int8" if compute_type in ("auto", "default") else compute_type
+                )
+                model_path = ModelCache(cache_dir).ctranslate2(model_name, quantization)
             self.model = WhisperModel(
-                model_name,
+                model_path,
                 device=device,
+                compute_type=compute_type,
                 download_root="./models/faster-whisper",
+                # Permite que varias sesiones transcriban en paralelo con el mismo modelo.
+                num_workers=num_workers,
+                # 0 = valor por defecto de CTranslate2 (un hilo por núcleo).
+                cpu_threads=self.resources.threads_per_decode or 0,
             )
             print(f"Modelo '{model_name}' cargado correctamente.")
 
@@ -259,7 +868,13 @@ class FasterWhisperEngine(TranscriptionEngine):
 
         self.sample_rate = sample_rate
         self.language = language
+        self.beam_size = beam_size
+        self.partial_beam_size = partial_beam_size
+        self.vad_filter = vad_filter
+        self.streaming = streaming
+        self.commit_margin_seconds = commit_margin_seconds
         self.audio_buffer = bytearray()
+        self.committed_text = ""
         print("Motor FasterWhisper listo.")
 
     def accept_waveform(self, audio_chunk: bytes):
@@ -267,30 +882,58 @@ class FasterWhisperEngine(TranscriptionEngine):
         self.audio_buffer.extend(audio_chunk)
         return False
 
-    def _transcribe_buffer(self) -> str:
-        """Función interna para transcribir el buffer actual."""
+    def _transcribe_buffer(self, beam_size: int) -> list:
+        """Función interna para transcribir el buffer actual. Devuelve los segmentos."""
         if not self.audio_buffer:
-            return ""
+            return []
 
         audio_np = (
             np.frombuffer(self.audio_buffer, dtype=np.int16).astype(np.float32)
             / 32768.0
         )
 
-        segments, info = self.model.transcribe(
-            audio_np, language=self.language, beam_size=5
-        )
-
-        full_text = "".join(segment.text for segment in segments)
+        # faster-whisper decodifica al iterar los segmentos.
+        with self.resources.slot(), profiler.span("ctranslate2_transcribe"):
+            segments, info = self.model.transcribe(
+                audio_np,
+                language=self.language,
+                beam_size=beam_size,
+                vad_filter=self.vad_filter,
+                initial_prompt=self.committed_text or None,
+            )
+            return list(segments)
 
-        return full_text.strip()
+    def _commit_finished_segments(self, segments: list) -> list:
+        """
+        Confirma los segmentos que terminan antes del margen final del buffer,
+        descarta su audio y devuelve los segmentos que siguen pendientes.
+        """
+        buffer_seconds = len(self.audio_buffer) / 2 / self.sample_rate
+        limit = buffer_seconds - self.commit_margin_seconds
+
+        finished = 0
+        # El último segmento nunca se confirma: puede seguir creciendo.
+        while finished < len(segments) - 1 and segments[finished].end <= limit:
+            finished += 1
+        if not finished:
+            return segments
+
+        committed = segments[:finished]
+        self.committed_text += "".join(segment.text for segment in committed)
+        cut = int(committed[-1].end * self.sample_rate) * 2
+        del self.audio_buffer[: min(cut, len(self.audio_buffer))]
+        return segments[finished:]
 
     def get_partial_result(self) -> str:
         """
         Realiza una transcripción del buffer actual para simular un resultado parcial.
-        No limpia el buffer.
+        En modo streaming confirma los segmentos terminados y recorta el buffer.
         """
-        return self._transcribe_buffer()
+        segments = self._transcribe_buffer(self.partial_beam_size)
+        if self.streaming:
+            segments = self._commit_finished_segments(segments)
+        pending_text = "".join(segment.text for segment in segments)
+        return (self.committed_text + pending_text).strip()
 
     def get_final_result(self) -> str:
         """
@@ -298,8 +941,270 @@ class FasterWhisperEngine(TranscriptionEngine):
         El reseteo del buffer se hace llamando a .reset() por separado.
         """
         print(f"Procesando audio final con FasterWhisper...")
-        return self._transcribe_buffer()
+        segments = self._transcribe_buffer(self.beam_size)
+        pending_text = "".join(segment.text for segment in segments)
+        return (self.committed_text + pending_text).strip()
 
     def reset(self):
         """Limpia el buffer de audio para la siguiente elocución."""
         self.audio_buffer.clear()
+        self.committed_text = ""
+
+    def warm_up(self, seconds: float = 1.0):
+        # Con el filtro VAD el silencio no llegaría a decodificarse.
+        vad_filter = self.vad_filter
+        self.vad_filter = False
+        try:
+            super().warm_up(seconds)
+        finally:
+            self.vad_filter = vad_filter
+
+    def new_session(self) -> "FasterWhisperEngine":
+        session = copy.copy(self)
+        session.audio_buffer = bytearray()
+        session.committed_text = ""
+        return session
+
+
+class OnnxWhisperEngine(TranscriptionEngine):
+    """
+    Whisper en ONNX Runtime para servidores sin GPU.
+
+    Usa el encoder y los dos decoders (sin y con caché) exportados por
+    `ModelCache.onnx_whisper`, con los pesos cuantizados a int8 de forma
+    dinámica. La decodificación es voraz: el primer paso del decoder procesa
+    los tokens iniciales y devuelve las claves/valores de la atención cruzada,
+    que no cambian durante toda la decodificación; los pasos siguientes sólo
+    reciben el último token y la caché. Con I/O binding las cachés se pasan
+    de un paso al siguiente como `OrtValue`, sin copiarlas a numpy.
+
+    Las sesiones de ONNX Runtime admiten llamadas concurrentes, así que
+    `new_session()` sólo copia el estado del audio.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        sample_rate: float,
+        language: str,
+        quantization: str | None = "int8",
+        intra_op_threads: int = 0,
+        inter_op_threads: int = 1,
+        cache_dir: str | None = None,
+        incremental_features: bool = True,
+        resources: ExecutionResources | None = None,
+    ):
+        super().__init__()
+        print(f"Inicializando motor: Whisper (ONNX Runtime) con modelo '{model_name}'")
+        self.resources = resources or UNMANAGED
+
+        try:
+            import onnxruntime as ort
+            from transformers import WhisperProcessor
+        except ImportError:
+            raise RuntimeError(
+                "No se encontró 'onnxruntime' o 'transformers'. El motor ONNX no está disponible."
+            )
+
+        try:
+            cache = ModelCache(cache_dir) if cache_dir is not None else ModelCache()
+            model_path = cache.onnx_whisper(model_name, quantization)
+            self.processor = WhisperProcessor.from_pretrained(
+                model_path, local_files_only=True
+            )
+            with open(os.path.join(model_path, "generation_config.json")) as f:
+                generation_config = json.load(f)
+            with open(os.path.join(model_path, "config.json")) as f:
+                max_target_positions = json.load(f)["max_target_positions"]
+
+            # 0 hilos = los de `resources`, o uno por núcleo físico si no hay.
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            options.intra_op_num_threads = (
+                intra_op_threads or self.resources.threads_per_decode or 0
+            )
+            options.inter_op_num_threads = inter_op_threads
+            if inter_op_threads > 1:
+                options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+            providers = ["CPUExecutionProvider"]
+            self.encoder, self.decoder, self.decoder_with_past = (
+                ort.InferenceSession(
+                    os.path.join(model_path, name), options, providers=providers
+                )
+                for name in ModelCache.ONNX_GRAPHS
+            )
+        except Exception as e:
+            raise RuntimeError(f"No se pudo cargar el modelo ONNX '{model_name}': {e}")
+
+        self.ort = ort
+        self.sample_rate = int(sample_rate)
+        self.bytes_per_second = self.sample_rate * 2
+        self.CHUNK_SECONDS = 30
+        self.bytes_per_chunk = self.bytes_per_second * self.CHUNK_SECONDS
+
+        tokenizer = self.processor.tokenizer
+        self.prompt_tokens = [generation_config["decoder_start_token_id"]] + [
+            token
+            for _, token in self.processor.get_decoder_prompt_ids(
+                language=language, task="transcribe", no_timestamps=True
+            )
+        ]
+        self.max_new_tokens = max_target_positions - len(self.prompt_tokens)
+        self.end_of_text = tokenizer.eos_token_id
+        # Lo mismo que suprime `generate`, más las marcas de tiempo.
+        self.suppress_tokens = np.array(
+            generation_config.get("suppress_tokens") or [], dtype=np.int64
+        )
+        self.begin_suppress_tokens = np.array(
+            generation_config.get("begin_suppress_tokens") or [], dtype=np.int64
+        )
+        self.first_timestamp = tokenizer.convert_tokens_to_ids("<|notimestamps|>") + 1
+
+        self.features = None
+        if incremental_features:
+            self.features = IncrementalLogMel.from_processor(self.processor)
+        self.audio_buffer = bytearray()
+        self.transcribed_text = ""
+        print("Motor Whisper (ONNX Runtime) listo.")
+
+    def accept_waveform(self, audio_chunk: bytes):
+        self.audio_buffer.extend(audio_chunk)
+        if self.features is not None:
+            self.features.append_pcm16(audio_chunk)
+        return False
+
+    def _input_features(self, audio_bytes: bytes) -> np.ndarray:
+        features = None
+        if self.features is not None and len(audio_bytes) == len(self.audio_buffer):
+            with profiler.span("feature_extraction"):
+                features = self.features.features()
+        if features is None:
+            audio_np = (
+                np.frombuffer(audio_bytes, dtype=np.int16).astype(np.float32) / 32768.0
+            )
+            with profiler.span("feature_extraction"):
+                features = self.processor(
+                    audio_np, sampling_rate=self.sample_rate, return_tensors="np"
+                ).input_features[0]
+        return np.ascontiguousarray(features[None], dtype=np.float32)
+
+    def _run(self, session, inputs: dict) -> dict:
+        """Ejecuta `session` con I/O binding; devuelve las salidas como OrtValue."""
+        binding = session.io_binding()
+        for name, value in inputs.items():
+            if isinstance(value, np.ndarray):
+                value = self.ort.OrtValue.ortvalue_from_numpy(value)
+            binding.bind_ortvalue_input(name, value)
+        names = [output.name for output in session.get_outputs()]
+        for name in names:
+            binding.bind_output(name, "cpu")
+        session.run_with_iobinding(binding)
+        return dict(zip(names, binding.get_outputs()))
+
+    def _next_token(self, logits, first: bool) -> int:
+        scores = logits.numpy()[0, -1]
+        scores[self.suppress_tokens] = -np.inf
+        scores[self.first_timestamp :] = -np.inf
+        if first:
+            scores[self.begin_suppress_tokens] = -np.inf
+        return int(scores.argmax())
+
+    def _decode(self, input_features: np.ndarray) -> str:
+        with profiler.span("onnx_encoder"):
+            hidden_states = self._run(self.encoder, {"input_features": input_features})[
+                "last_hidden_state"
+            ]
+
+        with profiler.span("onnx_decoder"):
+            outputs = self._run(
+                self.decoder,
+                {
+                    "input_ids": np.array([self.prompt_tokens], dtype=np.int64),
+                    "encoder_hidden_states": hidden_states,
+                },
+            )
+            # Las claves/valores de la atención cruzada sólo dependen del audio.
+            past = {
+                name.replace("present", "past_key_values", 1): value
+                for name, value in outputs.items()
+                if name.startswith("present")
+            }
+            tokens = []
+            token = self._next_token(outputs["logits"], first=True)
+            while token != self.end_of_text and len(tokens) < self.max_new_tokens:
+                tokens.append(token)
+                outputs = self._run(
+                    self.decoder_with_past,
+                    {"input_ids": np.array([[token]], dtype=np.int64), **past},
+                )
+                for name, value in outputs.items():
+                    if name.startswith("present"):
+                        past[name.replace("present", "past_key_values", 1)] = value
+                token = self._next_token(outputs["logits"], first=False)
+
+        return self.processor.tokenizer.decode(tokens, skip_special_tokens=True).strip()
+
+    def _transcribe(self, audio_bytes: bytes) -> str:
+        if not audio_bytes:
+            return ""
+        try:
+            input_features = self._input_features(audio_bytes)
+            with self.resources.slot():
+                return self._decode(input_features)
+        except Exception as e:
+            print(f"Error durante la transcripción del chunk: {e}")
+            return ""
+
+    def _commit_chunks(self):
+        """Transcribe y descarta los bloques completos de 30 s del buffer."""
+        while len(self.audio_buffer) >= self.bytes_per_chunk:
+            text = self._transcribe(bytes(self.audio_buffer[: self.bytes_per_chunk]))
+            if text:
+                self.transcribed_text += text + " "
+            del self.audio_buffer[: self.bytes_per_chunk]
+            if self.features is not None:
+                self.features.drop(self.bytes_per_chunk // 2)
+
+    def get_partial_result(self) -> str:
+        if len(self.audio_buffer) < self.sample_rate * 0.5:
+            return ""
+        self._commit_chunks()
+        return (self.transcribed_text + self._transcribe(self.audio_buffer)).strip()
+
+    def get_final_result(self) -> str:
+        self._commit_chunks()
+        self.transcribed_text += self._transcribe(self.audio_buffer)
+        text = self.transcribed_text.strip()
+        self.reset()
+        return text
+
+    def reset(self):
+        self.audio_buffer.clear()
+        self.transcribed_text = ""
+        if self.features is not None:
+            self.features.reset()
+
+    def new_session(self) -> "OnnxWhisperEngine":
+        session = copy.copy(self)
+        session.audio_buffer = bytearray()
+        session.transcribed_text = ""
+        if self.features is not None:
+            session.features = self.features.new()
+        return session
+
+
+# Registro de motores por nombre. Las clases no importan nada pesado hasta que
+# se instancian, así que registrar todas no tiene coste.
+ENGINES = {
+    "vosk": VoskEngine,
+    "whisper": WhisperEngine,
+    "faster-whisper": FasterWhisperEngine,
+    "onnx-whisper": OnnxWhisperEngine,
+}
+
+
+def create_engine(name: str, **options) -> TranscriptionEngine:
+    """Construye el motor `name`, cargando sólo sus dependencias."""
+    if name not in ENGINES:
+        raise ValueError(f"Motor '{name}' no reconocido.")
+    return ENGINES[name](**options)
@@ -0,0 +1,142 @@
+import numpy as np
+
+
+class IncrementalLogMel:
+    """
+    Espectrograma log-mel de Whisper calculado de forma incremental.
+
+    Reproduce `WhisperFeatureExtractor` (STFT centrada con padding reflect,
+    ventana Hann periódica, potencia, banco mel, log10 y la normalización
+    `max - 8`, `(x + 4) / 4`) sobre el audio rellenado con ceros hasta
+    `n_samples` (30 s). Las tramas cuya ventana ya cae entera dentro del audio
+    recibido no vuelven a cambiar y se guardan en caché antes de normalizar;
+    en cada llamada sólo se calculan las tramas nuevas y las dos o tres del
+    borde. Las tramas de relleno son todas iguales (log10 del suelo 1e-10).
+
+    `drop()` descarta audio del principio (segmentos confirmados) moviendo la
+    caché en lugar de recalcularla cuando el corte cae en un múltiplo del hop.
+    """
+
+    def __init__(
+        self,
+        mel_filters: np.ndarray,
+        n_fft: int = 400,
+        hop_length: int = 160,
+        n_samples: int = 480000,
+        mel_floor: float = 1e-10,
+    ):
+        # HF guarda los filtros como (frecuencias, mels).
+        self.mel_filters = np.ascontiguousarray(mel_filters.T, dtype=np.float32)
+        self.n_mels = self.mel_filters.shape[0]
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_samples = n_samples
+        self.n_frames = n_samples // hop_length
+        self.window = np.hanning(n_fft + 1)[:-1].astype(np.float32)
+        self.padding_value = np.float32(np.log10(mel_floor))
+        self.mel_floor = mel_floor
+        self.audio = np.empty(n_samples, dtype=np.float32)
+        self.length = 0
+        self.cache = np.empty((self.n_mels, self.n_frames), dtype=np.float32)
+        self.cached_frames = 0
+
+    @classmethod
+    def from_processor(cls, processor) -> "IncrementalLogMel":
+        extractor = processor.feature_extractor
+        return cls(
+            np.asarray(extractor.mel_filters),
+            n_fft=extractor.n_fft,
+            hop_length=extractor.hop_length,
+            n_samples=extractor.n_samples,
+        )
+
+    def new(self) -> "IncrementalLogMel":
+        """Un front end vacío con la misma configuración (para otra sesión)."""
+        return IncrementalLogMel(
+            self.mel_filters.T,
+            n_fft=self.n_fft,
+            hop_length=self.hop_length,
+            n_samples=self.n_samples,
+            mel_floor=self.mel_floor,
+        )
+
+    def append_pcm16(self, pcm: bytes):
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        end = self.length + len(samples)
+        if end > len(self.audio):
+            grown = np.empty(max(end, 2 * len(self.audio)), dtype=np.float32)
+            grown[: self.length] = self.audio[: self.length]
+            self.audio = grown
+        np.multiply(samples, np.float32(1 / 32768.0), out=self.audio[self.length : end])
+        self.length = end
+
+    def drop(self, samples: int):
+        """Descarta `samples` muestras del principio del audio."""
+        samples = min(samples, self.length)
+        self.audio[: self.length - samples] = self.audio[samples : self.length]
+        self.length -= samples
+        if samples % self.hop_length:
+            self.cached_frames = 0
+            return
+        shift = samples // self.hop_length
+        kept = max(0, self.cached_frames - shift)
+        self.cache[:, :kept] = self.cache[:, shift : shift + kept]
+        # Las primeras tramas usan el padding reflect del inicio: cambian.
+        reflected = min(kept, -(-(self.n_fft // 2) // self.hop_length))
+        if reflected:
+            self.cache[:, :reflected] = self._log_mel(0, reflected)
+        self.cached_frames = kept
+
+    def reset(self):
+        self.length = 0
+        self.cached_frames = 0
+
+    def _log_mel(self, first: int, last: int) -> np.ndarray:
+        """log10(mel) sin normalizar de las tramas [first, last)."""
+        half = self.n_fft // 2
+        offsets = np.arange(first, last)[:, None] * self.hop_length - half
+        indices = offsets + np.arange(self.n_fft)
+        # Padding reflect al inicio; ceros tras el audio (relleno hasta 30 s).
+        indices = np.abs(indices)
+        frames = np.zeros(indices.shape, dtype=np.float32)
+        inside = indices < self.length
+        frames[inside] = self.audio[indices[inside]]
+        frames *= self.window
+        spectrum = np.fft.rfft(frames, axis=1)
+        power = (spectrum.real**2 + spectrum.imag**2).astype(np.float32)
+        mel = self.mel_filters @ power.T
+        np.maximum(mel, self.mel_floor, out=mel)
+        return np.log10(mel, out=mel)
+
+    def features(self) -> np.ndarray | None:
+        """
+        Devuelve las características (n_mels, n_frames) del audio actual, o
+        None si no cabe en la ventana (el llamador debe usar el procesador).
+        """
+        half = self.n_fft // 2
+        if self.length > self.n_samples - half:
+            return None
+
+        # Tramas cuya ventana (incluido el reflect del inicio, que llega a la
+        # muestra `half`) cae entera dentro del audio: no cambiarán.
+        final_frames = 0
+        if self.length > half:
+            final_frames = min(self.n_frames, (self.length - half) // self.hop_length + 1)
+        if final_frames > self.cached_frames:
+            self.cache[:, self.cached_frames : final_frames] = self._log_mel(
+                self.cached_frames, final_frames
+            )
+            self.cached_frames = final_frames
+
+        # Tramas del borde: mezclan audio y relleno.
+        edge_frames = min(self.n_frames, -(-(self.length + half) // self.hop_length))
+        features = np.empty((self.n_mels, self.n_frames), dtype=np.float32)
+        features[:, :final_frames] = self.cache[:, :final_frames]
+        if edge_frames > final_frames:
+            features[:, final_frames:edge_frames] = self._log_mel(final_frames, edge_frames)
+        features[:, max(edge_frames, final_frames) :] = self.padding_value
+
+        np.maximum(features, features.max() - 8.0, out=features)
+        features += 4.0
+        features /= 4.0
+        return features
@@ -19,6 +19,9 @@ import sys
 import signal
 import time
 
+import audio_codec
+import protocol
+
 SERVER_IP = "127.0.0.1"
 SERVER_PORT = 8888
 SAMPLE_RATE = 16000
@@ -29,6 +32,10 @@ PID_FILE = "/tmp/transcription_popup.pid"
 VOICE_THRESHOLD = 1500
 GAIN_FACTOR = 1.8
 SMOOTHING_FACTOR = 0.2
+# Con True se envía PCM crudo y "[END]" como los servidores antiguos.
+LEGACY_PROTOCOL = False
+# "pcm", "adpcm" u "opus" (necesita opuslib). Sólo con el protocolo enmarcado.
+AUDIO_CODEC = "pcm"
 
 CSS_STYLES_TEMPLATE = """
 #transcription-popup {{
@@ -127,11 +134,25 @@ class TranscriptionPopup(Window):
 def audio_stream_thread(popup: TranscriptionPopup, client_socket: socket.socket):
     global audio_stream
     smooth_volume = 0.0
+    codec = audio_codec.CODEC_NAMES[AUDIO_CODEC]
+    encoder = None
+    if not LEGACY_PROTOCOL and codec != protocol.CODEC_PCM16:
+        encoder = audio_codec.create_encoder(codec, SAMPLE_RATE, CHANNELS)
 
     def audio_callback(indata, frames, time, status):
         nonlocal smooth_volume
         try:
-            client_socket.sendall(indata.tobytes())
+            if LEGACY_PROTOCOL:
+                client_socket.sendall(indata.tobytes())
+            elif encoder is not None:
+                for packet in encoder.encode(indata.tobytes()):
+                    client_socket.sendall(
+                        protocol.encode_frame(protocol.AUDIO, packet)
+                    )
+            else:
+                client_socket.sendall(
+                    protocol.encode_frame(protocol.AUDIO, indata.tobytes())
+                )
             rms = np.sqrt(np.mean(indata.astype(np.float32) ** 2))
             volume_normalized = np.clip((rms / VOICE_THRESHOLD) * GAIN_FACTOR, 0.0, 1.0)
             smooth_volume = (smooth_volume * (1 - SMOOTHING_FACTOR)) + (
@@ -192,7 +213,10 @@ def on_shutdown(application, sock: socket.socket):
     try:
         if sock:
             print("Enviando [END] al servidor...")
-            sock.sendall(b"[END]")
+            if LEGACY_PROTOCOL:
+                sock.sendall(protocol.LEGACY_END_MARKER)
+            else:
+                sock.sendall(protocol.encode_frame(protocol.END))
             sock.close()
     except Exception as e:
         print(f"Error al enviar [END] o cerrar el socket: {e}")
@@ -214,6 +238,14 @@ if __name__ == "__main__":
     try:
         client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         client_socket.connect((SERVER_IP, SERVER_PORT))
+        if not LEGACY_PROTOCOL:
+            client_socket.sendall(
+                protocol.encode_header(
+                    SAMPLE_RATE,
+                    codec=audio_codec.CODEC_NAMES[AUDIO_CODEC],
+                    channels=CHANNELS,
+                )
+            )
         print("¡Conectado al servidor!")
     except Exception as e:
         print(f"No se pudo conectar al servidor: {e}")
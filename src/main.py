@@ -1,11 +1,22 @@
+import argparse
+import atexit
 import sys
 import socket
 import time
 import threading
 
+import audio_codec
 import escritor as esc
+import metrics
 import popup
-from utils import increase_volume_pcm16, get_final_result
+import profiler
+import protocol
+from pipeline import PartialScheduler, SessionPipeline
+from resources import ExecutionResources
+import pool
+from pool import EnginePool
+from vad import VoiceActivityDetector
+from utils import PcmGain, get_final_result
 from gi.repository import GLib
 from fabric import Application
 
@@ -17,155 +28,411 @@ ENGINE_CHOICE = "whisper"
 VOSK_MODEL_PATH = "./models/vosk-model-es-0.42"
 WHISPER_MODEL_NAME = "Drazcat/whisper-small-es"
 FASTER_WHISPER_MODEL_NAME = "tiny"
+MODEL_CACHE_DIR = "./models/cache"
 WHISPER_LANGUAGE = "spanish"
 FASTER_WHISPER_LANGUAGE = "es"
+FASTER_WHISPER_DEVICE = "auto"
+FASTER_WHISPER_COMPUTE_TYPE = "int8"
+FASTER_WHISPER_BEAM_SIZE = 5
+FASTER_WHISPER_PARTIAL_BEAM_SIZE = 1
+FASTER_WHISPER_STREAMING = True
+ONNX_WHISPER_MODEL_NAME = "Drazcat/whisper-small-es"
+ONNX_QUANTIZATION = "int8"
+ONNX_INTRA_OP_THREADS = 0
+ONNX_INTER_OP_THREADS = 1
 TIMEOUT_PAUSA = 2.0
 TIMEOUT_ESPERA = 60.0
+POPUP_TIMEOUT = 300.0
+VAD_ENABLED = True
+VAD_ENDPOINT_MS = 400
+VAD_PAD_MS = 200
+RECV_BUFFER_SIZE = 4096
+INFERENCE_QUEUE_SIZE = 512
+MAX_SESSIONS = 4
+INFERENCE_THREADS = None
+INFERENCE_MAX_CONCURRENT = None
+INFERENCE_PIN_CORES = False
+LEASE_TIMEOUT = 30.0
+WARMUP_ENABLED = True
+WARMUP_TIMEOUT = 300.0
+WHISPER_BATCH_WAIT_MS = 10.0
+WHISPER_STREAMING = True
+WHISPER_INCREMENTAL_FEATURES = True
+WHISPER_PARTIAL_REUSE = False
+WHISPER_ASSISTANT_MODEL = None
+PARTIAL_UPDATE_INTERVAL = 0.5
+ADAPTIVE_PARTIALS = True
+PARTIAL_MIN_INTERVAL = 0.25
+PARTIAL_MAX_INTERVAL = 2.0
+PARTIAL_MAX_UTILIZATION = 0.5
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9100
+TRACE_DIR = None
 CSS_STYLES = popup.CSS_STYLES_TEMPLATE
 
+# Compartido por todas las sesiones: reparte la capacidad del motor.
+partial_scheduler = PartialScheduler(
+    min_interval=PARTIAL_MIN_INTERVAL,
+    max_interval=PARTIAL_MAX_INTERVAL,
+    utilization=PARTIAL_MAX_UTILIZATION,
+)
+
+
+def idle_add(function, *args):
+    """GLib.idle_add; en modo perfilado mide la espera y el callback de la UI."""
+    return GLib.idle_add(profiler.wrap("ui_dispatch", function), *args)
+
 
 def handle_client_connection(conn, addr, popup_window, engine: esc.TranscriptionEngine):
     print(f"Cliente conectado: {addr}. Usando motor: {engine.__class__.__name__}")
 
-    close_event = threading.Event()
+    # El popup es compartido: cada sesión sólo oculta el que muestra ella.
+    popup_owner = object()
     is_final_result_shown = False
+    has_pending_audio = False
+    # El cliente pidió recibir los textos (CONFIG {"results": true}).
+    send_results = False
+    # PING se responde desde este hilo y los textos desde el de inferencia.
+    send_lock = threading.Lock()
 
+    trace = metrics.SessionTrace(TRACE_DIR, addr) if TRACE_DIR else metrics.NullTrace()
+    trace.event("connect", engine=engine.__class__.__name__)
     conn.settimeout(TIMEOUT_ESPERA)
     engine.reset()
-    reception_buffer = bytearray()
-    last_partial_time = time.time()
-    PARTIAL_UPDATE_INTERVAL = 0.5
+    stream = protocol.StreamReader(RECV_BUFFER_SIZE)
+    decoder = None
+    gain = PcmGain(VOLUME_MULTIPLIER, protocol.MAX_PAYLOAD // 2)
+    vad = None
+    if VAD_ENABLED:
+        vad = VoiceActivityDetector(
+            SAMPLE_RATE, endpoint_ms=VAD_ENDPOINT_MS, pad_ms=VAD_PAD_MS
+        )
+
+    def send_frame(frame: bytes):
+        try:
+            with send_lock:
+                conn.sendall(frame)
+        except OSError:
+            pass
+
+    def show_partial(partial_text):
+        idle_add(popup_window.update_text, f"{partial_text}...", popup_owner)
+        if send_results:
+            send_frame(protocol.encode_text(protocol.PARTIAL, partial_text))
 
-    def process_transcription():
+    def show_final(text):
         nonlocal is_final_result_shown
-        text = engine.get_final_result()
+        if send_results:
+            send_frame(protocol.encode_text(protocol.FINAL, text))
         if text:
             print(f"[{addr}] Final: {text}")
-            GLib.idle_add(
-                popup_window.show_final_result, text.capitalize(), close_event
+            idle_add(
+                popup_window.show_final_result,
+                text.capitalize(),
+                popup_owner,
+                POPUP_TIMEOUT,
             )
             is_final_result_shown = True
         else:
-            if popup_window.is_visible():
-                GLib.idle_add(popup_window.hide)
+            idle_add(popup_window.hide_for, popup_owner)
+
+    is_whisper = isinstance(
+        engine, (esc.WhisperEngine, esc.FasterWhisperEngine, esc.OnnxWhisperEngine)
+    )
+    inference = SessionPipeline(
+        engine,
+        on_partial=show_partial,
+        on_final=show_final,
+        max_queue_items=INFERENCE_QUEUE_SIZE,
+        partial_interval=PARTIAL_UPDATE_INTERVAL if is_whisper else 0.0,
+        sample_rate=SAMPLE_RATE,
+        trace=trace,
+        scheduler=partial_scheduler if is_whisper and ADAPTIVE_PARTIALS else None,
+    )
 
-        print("Transmisión terminada. Esperando cierre manual.")
-        engine.reset()
+    def process_transcription(reason: str):
+        nonlocal has_pending_audio
+        trace.event(reason, pending_audio=has_pending_audio)
+        if vad is not None:
+            # Un final por silencio conserva el audio que sigue al silencio
+            # (pendiente y pre-roll): es el inicio de la siguiente elocución.
+            if reason == "vad":
+                vad.end_utterance()
+            else:
+                vad.reset()
+            if not has_pending_audio:
+                # El VAD ya cerró la elocución; un [END] o timeout posterior
+                # no debe ocultar el resultado que se está mostrando. Los
+                # clientes que reciben textos sí reciben un FINAL vacío, detrás
+                # del final pendiente, para saber que la elocución se cerró.
+                if send_results:
+                    inference.submit_call(
+                        lambda: send_frame(protocol.encode_text(protocol.FINAL, ""))
+                    )
+                conn.settimeout(TIMEOUT_ESPERA)
+                return
+        has_pending_audio = False
+        inference.submit_final(reason)
         conn.settimeout(TIMEOUT_ESPERA)
 
+    def decode_audio(payload):
+        if decoder is None:
+            return payload
+        with profiler.span("codec_decode"):
+            return decoder.decode(payload)
+
+    def process_audio(audio_to_process):
+        with profiler.span("gain"):
+            audio_to_process = gain.apply(audio_to_process)
+        endpoint = False
+        if vad is not None:
+            with profiler.span("vad"):
+                audio_to_process, endpoint = vad.process(audio_to_process)
+        if audio_to_process:
+            feed_engine(bytes(audio_to_process))
+        if endpoint:
+            print(f"[{addr}] Final por silencio (VAD).")
+            process_transcription("vad")
+
+    def feed_engine(audio_to_process):
+        nonlocal has_pending_audio
+        has_pending_audio = True
+        if not popup_window.is_visible() and audio_to_process:
+            print(f"[{addr}] Nueva elocución detectada. Mostrando popup.")
+            idle_add(popup_window.set_position_from_cursor)
+            idle_add(popup_window.update_text, "Escuchando...", popup_owner)
+            idle_add(popup_window.show_all)
+            conn.settimeout(TIMEOUT_PAUSA)
+
+        with profiler.span("enqueue"):
+            inference.submit_audio(audio_to_process)
+
     while True:
         try:
-            data_chunk = conn.recv(1024)
-            if not data_chunk:
+            received = stream.read(conn)
+            if not received:
                 print(f"[{addr}] Cliente desconectado (flujo finalizado).")
                 break
+            metrics.BYTES_RECEIVED.inc(received)
 
-            reception_buffer.extend(data_chunk)
-            end_signal_pos = reception_buffer.find(b"[END]")
-
-            if end_signal_pos != -1:
-                print(f"[{addr}] Señal de fin instantánea recibida.")
-                audio_to_process = reception_buffer[:end_signal_pos]
-                engine.accept_waveform(
-                    increase_volume_pcm16(audio_to_process, VOLUME_MULTIPLIER)
-                )
-                process_transcription()
-                reception_buffer.clear()
-                continue
-
-            audio_to_process = bytes(reception_buffer)
-
-            if not popup_window.is_visible() and audio_to_process:
-                print(f"[{addr}] Nueva elocución detectada. Mostrando popup.")
-                GLib.idle_add(popup_window.set_position_from_cursor)
-                GLib.idle_add(popup_window.update_text, "Escuchando...")
-                GLib.idle_add(popup_window.show_all)
-                conn.settimeout(TIMEOUT_PAUSA)
-
-            if not engine.accept_waveform(
-                increase_volume_pcm16(audio_to_process, VOLUME_MULTIPLIER)
-            ):
-                partial_text = ""
-                is_whisper = isinstance(
-                    engine, (esc.WhisperEngine, esc.FasterWhisperEngine)
-                )
-                if is_whisper:
-                    current_time = time.time()
-                    if (current_time - last_partial_time) > PARTIAL_UPDATE_INTERVAL:
-                        partial_text = engine.get_partial_result()
-                        last_partial_time = current_time
-                else:
-                    partial_text = engine.get_partial_result()
-                if partial_text:
-                    GLib.idle_add(popup_window.update_text, f"{partial_text}...")
-
-            reception_buffer.clear()
+            # Sólo el trabajo sobre los bytes recibidos; no la espera en recv.
+            with profiler.span("receive"):
+                for frame_type, payload in stream.events():
+                    if decoder is None and stream.header is not None:
+                        # Se comprueba una sola vez, al leer la cabecera: el
+                        # motor no remuestrea y con otra frecuencia sólo
+                        # produciría texto basura.
+                        if stream.header.sample_rate != SAMPLE_RATE:
+                            raise protocol.ProtocolError(
+                                f"El cliente envía {stream.header.sample_rate} Hz "
+                                f"y el servidor espera {int(SAMPLE_RATE)} Hz."
+                            )
+                        decoder = audio_codec.create_decoder(
+                            stream.header.codec,
+                            stream.header.sample_rate,
+                            stream.header.channels,
+                        )
+                    if frame_type == protocol.AUDIO:
+                        process_audio(decode_audio(payload))
+                    elif frame_type == protocol.END:
+                        print(f"[{addr}] Señal de fin instantánea recibida.")
+                        process_transcription("end")
+                    elif frame_type == protocol.PING:
+                        send_frame(protocol.encode_frame(protocol.PING, payload))
+                    elif frame_type == protocol.CONFIG:
+                        print(f"[{addr}] Configuración del cliente: {bytes(payload)!r}")
+                        try:
+                            config = protocol.decode_config(payload)
+                        except protocol.ProtocolError as e:
+                            print(f"[{addr}] {e}")
+                            continue
+                        send_results = bool(config.get("results", send_results))
+                    else:
+                        print(f"[{addr}] Trama desconocida ({frame_type}), ignorada.")
 
         except socket.timeout:
             print(f"[{addr}] Final por pausa (timeout).")
-            process_transcription()
-            reception_buffer.clear()
+            process_transcription("timeout")
             continue
         except (ConnectionResetError, BrokenPipeError):
             print(f"\n[{addr}] Conexión cerrada por el cliente.")
             break
+        except protocol.ProtocolError as e:
+            print(f"\n[{addr}] Error de protocolo: {e}")
+            break
         except Exception as e:
             print(f"\n[{addr}] Error inesperado durante la conexión: {e}")
             break
 
-    if is_final_result_shown:
-        print("El hilo del servidor está en espera a que el popup se cierre...")
-        closed_in_time = close_event.wait(timeout=300.0)  # 5 minutos de timeout
-        if not closed_in_time:
-            print("Timeout de espera. Ocultando popup automáticamente.")
-            GLib.idle_add(popup_window.hide)
+    inference.close()
+    if inference.skipped_partials:
+        print(f"[{addr}] Parciales omitidos por retraso: {inference.skipped_partials}")
+    trace.event("disconnect", skipped_partials=inference.skipped_partials)
+    trace.close()
 
+    # El resultado final queda en el popup hasta que se cierre o pasen
+    # POPUP_TIMEOUT segundos, sin retener el motor ni el hueco de la sesión.
+    # Un cliente que recibe los textos ya los ha mostrado.
     print(f"[{addr}] Finalizando sesión de conexión.")
-    if popup_window.is_visible():
-        GLib.idle_add(popup_window.hide)
+    if send_results or not is_final_result_shown:
+        idle_add(popup_window.hide_for, popup_owner)
     conn.close()
 
 
-def start_server_logic(popup_window, app):
+def build_engine() -> esc.TranscriptionEngine:
+    """Construye el motor elegido; sólo se importan las dependencias de ese motor."""
+    # Decodificaciones simultáneas de cada motor: Whisper (HF) decodifica
+    # todas las sesiones en el hilo del lote; Vosk, una por núcleo.
+    concurrent_decodes = {"whisper": 1, "vosk": None}.get(ENGINE_CHOICE, MAX_SESSIONS)
+    resources = ExecutionResources.for_engine(
+        concurrent_decodes,
+        threads_per_decode=INFERENCE_THREADS,
+        max_concurrent=INFERENCE_MAX_CONCURRENT,
+        pin_cores=INFERENCE_PIN_CORES,
+    )
+    # Whisper (HF) sirve los parciales de todas las sesiones en un lote: la
+    # latencia medida de un parcial ya cubre a las que hablan a la vez.
+    partial_scheduler.batch_size = MAX_SESSIONS if ENGINE_CHOICE == "whisper" else 1
+    # Antes de que el motor importe torch/vosk y creen sus pools de hilos.
+    resources.apply_environment()
+    engine_options = {
+        "vosk": dict(model_path=VOSK_MODEL_PATH, sample_rate=SAMPLE_RATE),
+        "whisper": dict(
+            model_name=WHISPER_MODEL_NAME,
+            sample_rate=SAMPLE_RATE,
+            language=WHISPER_LANGUAGE,
+            max_batch_size=MAX_SESSIONS,
+            batch_wait_ms=WHISPER_BATCH_WAIT_MS,
+            streaming=WHISPER_STREAMING,
+            cache_dir=MODEL_CACHE_DIR,
+            incremental_features=WHISPER_INCREMENTAL_FEATURES,
+            # La cadencia la decide la sesión; el motor no vuelve a limitarla.
+            partial_interval=0.0 if ADAPTIVE_PARTIALS else PARTIAL_UPDATE_INTERVAL,
+            reuse_partials=WHISPER_PARTIAL_REUSE,
+            assistant_model_name=WHISPER_ASSISTANT_MODEL,
+        ),
+        "faster-whisper": dict(
+            model_name=FASTER_WHISPER_MODEL_NAME,
+            sample_rate=SAMPLE_RATE,
+            language=FASTER_WHISPER_LANGUAGE,
+            num_workers=MAX_SESSIONS,
+            device=FASTER_WHISPER_DEVICE,
+            compute_type=FASTER_WHISPER_COMPUTE_TYPE,
+            beam_size=FASTER_WHISPER_BEAM_SIZE,
+            partial_beam_size=FASTER_WHISPER_PARTIAL_BEAM_SIZE,
+            streaming=FASTER_WHISPER_STREAMING,
+            cache_dir=MODEL_CACHE_DIR,
+        ),
+        "onnx-whisper": dict(
+            model_name=ONNX_WHISPER_MODEL_NAME,
+            sample_rate=SAMPLE_RATE,
+            language=WHISPER_LANGUAGE,
+            quantization=ONNX_QUANTIZATION,
+            intra_op_threads=ONNX_INTRA_OP_THREADS,
+            inter_op_threads=ONNX_INTER_OP_THREADS,
+            cache_dir=MODEL_CACHE_DIR,
+            incremental_features=WHISPER_INCREMENTAL_FEATURES,
+        ),
+    }
+    options = engine_options.get(ENGINE_CHOICE, {})
+    return esc.create_engine(ENGINE_CHOICE, resources=resources, **options)
+
+
+def open_server_socket(host: str = HOST, port: int = PORT) -> socket.socket:
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     try:
-        if ENGINE_CHOICE == "vosk":
-            engine = esc.VoskEngine(VOSK_MODEL_PATH, SAMPLE_RATE)
-        elif ENGINE_CHOICE == "whisper":
-            engine = esc.WhisperEngine(
-                WHISPER_MODEL_NAME, SAMPLE_RATE, WHISPER_LANGUAGE
-            )
-        elif ENGINE_CHOICE == "faster-whisper":
-            engine = esc.FasterWhisperEngine(
-                FASTER_WHISPER_MODEL_NAME, SAMPLE_RATE, FASTER_WHISPER_LANGUAGE
-            )
-        else:
-            raise ValueError(f"Motor '{ENGINE_CHOICE}' no reconocido.")
+        s.bind((host, port))
+        s.listen()
+    except OSError:
+        s.close()
+        raise
+    return s
+
+
+def session_thread(conn, addr, popup_window, engine_pool: EnginePool):
+    """
+    Atiende una conexión en su propio hilo con un motor prestado por el pool.
+    Si el motor aún se está calentando, avisa a los clientes enmarcados con
+    una trama STATUS y espera; si todas las sesiones están ocupadas, espera su
+    turno en la cola del pool.
+    """
+    metrics.CONNECTIONS.inc()
+    try:
+        if engine_pool.status == pool.WARMING:
+            framed = protocol.peek_is_framed(conn, timeout=1.0)
+            if framed:
+                conn.sendall(protocol.encode_status(pool.WARMING))
+            print(f"[{addr}] El motor se está calentando. Esperando...")
+            if engine_pool.wait_ready(WARMUP_TIMEOUT) and framed:
+                conn.sendall(protocol.encode_status(pool.READY))
+        if engine_pool.active >= engine_pool.max_sessions:
+            print(f"[{addr}] Todas las sesiones ocupadas. Esperando turno...")
+        with engine_pool.lease(timeout=LEASE_TIMEOUT) as engine:
+            handle_client_connection(conn, addr, popup_window, engine)
+    except TimeoutError as e:
+        print(f"[{addr}] {e} Cerrando la conexión.")
+        conn.close()
     except Exception as e:
-        print(f"Error fatal al inicializar el motor de transcripción: {e}")
+        print(f"[{addr}] Error en la sesión: {e}")
+        conn.close()
+
+
+def start_server_logic(popup_window, app):
+    try:
+        server_socket = open_server_socket()
+        print(f"Servidor escuchando en {HOST}:{PORT} (calentando el motor)...")
+    except OSError as e:
+        print(f"Error crítico al iniciar el servidor: {e}")
         GLib.idle_add(app.quit)
         return
 
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    # El socket ya acepta conexiones mientras el modelo carga y se calienta.
+    engine_pool = EnginePool(build_engine, MAX_SESSIONS)
+    metrics.ACTIVE_SESSIONS.set_function(lambda: engine_pool.active)
+    metrics.WAITING_SESSIONS.set_function(lambda: engine_pool.waiting)
+    if METRICS_PORT is not None:
         try:
-            s.bind((HOST, PORT))
-            s.listen()
-            print(f"Servidor escuchando en {HOST}:{PORT}...")
+            metrics.serve(METRICS_HOST, METRICS_PORT)
+            print(f"Métricas en http://{METRICS_HOST}:{METRICS_PORT}/metrics")
         except OSError as e:
-            print(f"Error crítico al iniciar el servidor: {e}")
-            GLib.idle_add(app.quit)
-            return
+            print(f"No se pudieron exponer las métricas: {e}")
+    engine_pool.start(
+        warm_up=WARMUP_ENABLED, on_failure=lambda e: GLib.idle_add(app.quit)
+    )
+    if WARMUP_ENABLED:
+        # La compilación JIT del ADPCM no debe parar la primera sesión que lo use.
+        threading.Thread(target=audio_codec.warm_up, daemon=True).start()
 
+    with server_socket as s:
         while True:
             try:
                 conn, addr = s.accept()
-                handle_client_connection(conn, addr, popup_window, engine)
+                threading.Thread(
+                    target=session_thread,
+                    args=(conn, addr, popup_window, engine_pool),
+                    daemon=True,
+                ).start()
             except Exception as e:
                 print(f"Error en el bucle principal del servidor: {e}")
                 time.sleep(1)
 
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor de transcripción.")
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="profile",
+        metavar="PREFIJO",
+        help="Mide cada etapa y, al salir, escribe PREFIJO.spans.folded, "
+        "PREFIJO.samples.folded y un resumen por etapa.",
+    )
+    args = parser.parse_args(argv)
+    if args.profile:
+        profiler.start()
+        atexit.register(profiler.stop, args.profile)
+
     popup_window = popup.TranscriptionPopup()
     app = Application("modular-transcriber", popup_window, standalone=True)
     final_css = popup.load_pywal_css(CSS_STYLES)
@@ -0,0 +1,332 @@
+"""
+Métricas del servidor en formato de texto de Prometheus.
+
+Contadores, gauges e histogramas en memoria, sin dependencias externas, que
+`serve()` expone en `http://<host>:<puerto>/metrics`. Actualizar una métrica
+cuesta un lock y unas sumas, así que se puede hacer en el camino caliente.
+
+`SessionTrace` escribe opcionalmente un log JSON Lines por sesión con la
+marca de tiempo de cada evento (audio recibido, decodificaciones, textos).
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Segundos: de 1 ms a 30 s.
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+RTF_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 4.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+
+    def labels(self, *values):
+        """Devuelve la serie con esos valores de etiqueta (creándola si hace falta)."""
+        values = tuple(str(v) for v in values)
+        with self._lock:
+            child = self._children.get(values)
+            if child is None:
+                child = self._children[values] = self._new_child()
+            return child
+
+    @abstractmethod
+    def _new_child(self):
+        """Crea la serie de una combinación de etiquetas."""
+        pass
+
+    def _default(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name} necesita etiquetas {self.labelnames}.")
+        return self.labels()
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            lines.extend(child.samples(self.name, _format_labels(self.labelnames, values)))
+        return lines
+
+
+class _CounterValue:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name: str, labels: str) -> list[str]:
+        return [f"{name}{labels} {self.value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+
+class _GaugeValue(_CounterValue):
+    def __init__(self):
+        super().__init__()
+        self.function = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def samples(self, name: str, labels: str) -> list[str]:
+        value = self.function() if self.function is not None else self.value
+        return [f"{name}{labels} {value}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default().dec(amount)
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def set_function(self, function):
+        """El valor se lee de `function()` al exportar (p. ej. sesiones activas)."""
+        self._default().function = function
+
+
+class _HistogramValue:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def samples(self, name: str, labels: str) -> list[str]:
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        lines = []
+        cumulative = 0
+        label_body = labels[1:-1]
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            bucket_labels = "{" + ",".join(filter(None, [label_body, f'le="{le}"'])) + "}"
+            lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+        lines.append(f"{name}_sum{labels} {total}")
+        lines.append(f"{name}_count{labels} {cumulative}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help_text: str, labelnames: tuple = (), buckets=LATENCY_BUCKETS
+    ):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def expose(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+BYTES_RECEIVED = REGISTRY.register(
+    Counter("transcriber_bytes_received_total", "Bytes leídos de los sockets de los clientes.")
+)
+AUDIO_SECONDS = REGISTRY.register(
+    Counter("transcriber_audio_seconds_total", "Segundos de audio entregados al motor.")
+)
+RECV_TO_ENGINE = REGISTRY.register(
+    Histogram(
+        "transcriber_recv_to_engine_seconds",
+        "Espera del audio en la cola de la sesión antes de llegar al motor.",
+    )
+)
+ENGINE_SECONDS = REGISTRY.register(
+    Histogram(
+        "transcriber_engine_seconds",
+        "Duración de cada llamada al motor por etapa.",
+        ("stage",),
+    )
+)
+ENGINE_RTF = REGISTRY.register(
+    Histogram(
+        "transcriber_engine_rtf",
+        "Tiempo de motor por segundo de audio de cada elocución.",
+        buckets=RTF_BUCKETS,
+    )
+)
+QUEUE_ITEMS = REGISTRY.register(
+    Gauge("transcriber_inference_queue_items", "Elementos pendientes en las colas de inferencia.")
+)
+QUEUE_DEPTH = REGISTRY.register(
+    Histogram(
+        "transcriber_inference_queue_depth",
+        "Profundidad de la cola de la sesión al encolar audio.",
+        buckets=SIZE_BUCKETS,
+    )
+)
+SKIPPED_PARTIALS = REGISTRY.register(
+    Counter("transcriber_skipped_partials_total", "Parciales omitidos por retraso.")
+)
+OVERLOAD_SKIPPED_PARTIALS = REGISTRY.register(
+    Counter(
+        "transcriber_overload_skipped_partials_total",
+        "Parciales omitidos porque el planificador detectó sobrecarga.",
+    )
+)
+PARTIAL_INTERVAL = REGISTRY.register(
+    Histogram(
+        "transcriber_partial_interval_seconds",
+        "Intervalo entre parciales elegido por el planificador.",
+        buckets=(0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0),
+    )
+)
+UTTERANCES = REGISTRY.register(
+    Counter("transcriber_utterances_total", "Elocuciones finalizadas por causa.", ("reason",))
+)
+ACTIVE_SESSIONS = REGISTRY.register(
+    Gauge("transcriber_active_sessions", "Sesiones con un motor prestado.")
+)
+WAITING_SESSIONS = REGISTRY.register(
+    Gauge("transcriber_waiting_sessions", "Conexiones esperando un motor libre.")
+)
+CONNECTIONS = REGISTRY.register(
+    Counter("transcriber_connections_total", "Conexiones aceptadas.")
+)
+DECODE_SLOT_WAIT = REGISTRY.register(
+    Histogram(
+        "transcriber_decode_slot_wait_seconds",
+        "Espera por un hueco de CPU antes de cada decodificación.",
+    )
+)
+ACTIVE_DECODES = REGISTRY.register(
+    Gauge("transcriber_active_decodes", "Decodificaciones ejecutándose ahora mismo.")
+)
+BATCH_SIZE = REGISTRY.register(
+    Histogram(
+        "transcriber_whisper_batch_size",
+        "Peticiones agrupadas en cada lote de Whisper.",
+        buckets=SIZE_BUCKETS,
+    )
+)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.expose().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host: str, port: int) -> ThreadingHTTPServer:
+    """Sirve /metrics en un hilo aparte y devuelve el servidor HTTP."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class SessionTrace:
+    """Log JSON Lines de una sesión; `t` es el tiempo desde que empezó."""
+
+    def __init__(self, directory: str, addr):
+        os.makedirs(directory, exist_ok=True)
+        name = "-".join(str(part) for part in (addr if isinstance(addr, tuple) else (addr,)))
+        path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}.jsonl")
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def event(self, name: str, **fields):
+        fields["t"] = round(time.perf_counter() - self._start, 6)
+        fields["event"] = name
+        line = json.dumps(fields, ensure_ascii=False)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class NullTrace:
+    """Sustituto de SessionTrace cuando el log por sesión está desactivado."""
+
+    def event(self, name: str, **fields):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,202 @@
+"""
+Caché local de artefactos de modelo optimizados.
+
+La primera vez que se pide un modelo se descarga, se convierte y se guarda
+en `models/cache`; en los arranques siguientes se carga directamente del
+disco, sin red y sin conversión:
+
+- `whisper_hf`: processor + pesos en safetensors (que se cargan con mmap) +
+  la configuración de generación corregida, para WhisperEngine.
+- `ctranslate2`: conversión CTranslate2 cuantizada (int8 por defecto) de un
+  modelo de Hugging Face como `Drazcat/whisper-small-es`, o el modelo
+  oficial de faster-whisper si el nombre es uno de sus tamaños ("tiny", ...).
+- `onnx_whisper`: encoder y decoders (sin y con caché de claves/valores)
+  exportados a ONNX con optimum y cuantizados a int8 de forma dinámica,
+  para OnnxWhisperEngine.
+
+También se puede preparar la caché por adelantado:
+    python model_cache.py whisper Drazcat/whisper-small-es
+    python model_cache.py ct2 Drazcat/whisper-small-es --quantization int8
+    python model_cache.py onnx Drazcat/whisper-small-es --quantization int8
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+
+CACHE_DIR = "./models/cache"
+MANIFEST = "manifest.json"
+
+
+class ModelCache:
+    # Grafos de `onnx_whisper`, en el orden en que los carga OnnxWhisperEngine.
+    ONNX_GRAPHS = ("encoder_model.onnx", "decoder_model.onnx", "decoder_with_past_model.onnx")
+
+    def __init__(self, root: str = CACHE_DIR):
+        self.root = root
+
+    def _path(self, kind: str, model_name: str, suffix: str = "") -> str:
+        slug = model_name.replace("/", "--") + (f"-{suffix}" if suffix else "")
+        return os.path.join(self.root, kind, slug)
+
+    def _is_complete(self, path: str) -> bool:
+        return os.path.exists(os.path.join(path, MANIFEST))
+
+    def _build(self, path: str, build, manifest: dict) -> str:
+        """Construye el artefacto en un directorio temporal y lo publica al final,
+        para que un arranque interrumpido nunca deje una caché a medias."""
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        start = time.perf_counter()
+        try:
+            build(tmp_path)
+        except Exception:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        manifest["build_seconds"] = round(time.perf_counter() - start, 2)
+        manifest["created"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        with open(os.path.join(tmp_path, MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=2)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        print(f"[Caché] Artefacto guardado en '{path}'.")
+        return path
+
+    def whisper_hf(
+        self, model_name: str, generation_config_name: str = "openai/whisper-small"
+    ) -> str:
+        """Directorio local con el modelo Whisper de Hugging Face listo para cargar."""
+        path = self._path("hf", model_name)
+        if self._is_complete(path):
+            return path
+
+        def build(tmp_path):
+            from transformers import (
+                GenerationConfig,
+                WhisperForConditionalGeneration,
+                WhisperProcessor,
+            )
+
+            print(f"[Caché] Descargando '{model_name}' para guardarlo en safetensors...")
+            processor = WhisperProcessor.from_pretrained(model_name)
+            model = WhisperForConditionalGeneration.from_pretrained(model_name)
+            model.generation_config = GenerationConfig.from_pretrained(
+                generation_config_name
+            )
+            processor.save_pretrained(tmp_path)
+            model.save_pretrained(tmp_path, safe_serialization=True)
+
+        manifest = {
+            "kind": "whisper-hf",
+            "source": model_name,
+            "generation_config": generation_config_name,
+        }
+        return self._build(path, build, manifest)
+
+    def ctranslate2(self, model_name: str, quantization: str = "int8") -> str:
+        """Directorio local con el modelo CTranslate2 cuantizado para faster-whisper."""
+        path = self._path("ct2", model_name, quantization)
+        if self._is_complete(path):
+            return path
+
+        def build(tmp_path):
+            from faster_whisper.utils import available_models, download_model
+
+            if model_name in available_models():
+                print(f"[Caché] Descargando el modelo de faster-whisper '{model_name}'...")
+                download_model(model_name, output_dir=tmp_path)
+                return
+
+            from ctranslate2.converters import TransformersConverter
+
+            print(f"[Caché] Convirtiendo '{model_name}' a CTranslate2 ({quantization})...")
+            converter = TransformersConverter(
+                model_name,
+                copy_files=["tokenizer.json", "preprocessor_config.json"],
+                low_cpu_mem_usage=True,
+            )
+            converter.convert(tmp_path, quantization=quantization, force=True)
+
+        manifest = {
+            "kind": "ctranslate2",
+            "source": model_name,
+            "quantization": quantization,
+        }
+        return self._build(path, build, manifest)
+
+    def onnx_whisper(
+        self,
+        model_name: str,
+        quantization: str | None = "int8",
+        generation_config_name: str = "openai/whisper-small",
+    ) -> str:
+        """Directorio local con Whisper exportado a ONNX (y cuantizado) para CPU."""
+        path = self._path("onnx", model_name, quantization or "fp32")
+        if self._is_complete(path):
+            return path
+
+        def build(tmp_path):
+            from optimum.exporters.onnx import main_export
+            from transformers import GenerationConfig, WhisperProcessor
+
+            export_path = os.path.join(tmp_path, "fp32")
+            print(f"[Caché] Exportando '{model_name}' a ONNX...")
+            # Sin post-proceso: decoders separados en lugar del grafo fusionado
+            # con `use_cache_branch`.
+            main_export(
+                model_name,
+                output=export_path,
+                task="automatic-speech-recognition-with-past",
+                no_post_process=True,
+            )
+            for name in self.ONNX_GRAPHS:
+                if quantization is None:
+                    shutil.move(os.path.join(export_path, name), tmp_path)
+                    continue
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+
+                print(f"[Caché] Cuantizando {name} ({quantization})...")
+                quantize_dynamic(
+                    os.path.join(export_path, name),
+                    os.path.join(tmp_path, name),
+                    weight_type={"int8": QuantType.QInt8, "uint8": QuantType.QUInt8}[
+                        quantization
+                    ],
+                )
+            shutil.move(os.path.join(export_path, "config.json"), tmp_path)
+            shutil.rmtree(export_path)
+            WhisperProcessor.from_pretrained(model_name).save_pretrained(tmp_path)
+            GenerationConfig.from_pretrained(generation_config_name).save_pretrained(tmp_path)
+
+        manifest = {
+            "kind": "onnx-whisper",
+            "source": model_name,
+            "quantization": quantization,
+            "generation_config": generation_config_name,
+        }
+        return self._build(path, build, manifest)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepara la caché de modelos.")
+    parser.add_argument("kind", choices=["whisper", "ct2", "onnx"])
+    parser.add_argument("model_name")
+    parser.add_argument("--quantization", default="int8")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    args = parser.parse_args()
+
+    cache = ModelCache(args.cache_dir)
+    if args.kind == "whisper":
+        print(cache.whisper_hf(args.model_name))
+    elif args.kind == "onnx":
+        quantization = None if args.quantization in ("none", "fp32") else args.quantization
+        print(cache.onnx_whisper(args.model_name, quantization))
+    else:
+        print(cache.ctranslate2(args.model_name, args.quantization))
+
+
+if __name__ == "__main__":
+    main()
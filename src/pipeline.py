@@ -0,0 +1,242 @@
+import math
+import queue
+import threading
+import time
+
+import metrics
+import profiler
+from escritor import TranscriptionEngine
+
+AUDIO = "audio"
+FINAL = "final"
+CALL = "call"
+
+
+class PartialScheduler:
+    """
+    Cadencia de parciales compartida por todas las sesiones de un motor.
+
+    Cada sesión mide cuánto tarda su parcial (media móvil exponencial) y pide
+    a la vez su intervalo: si hay `N` sesiones hablando y un parcial cuesta
+    `L` segundos, para que los parciales no ocupen más de `utilization` del
+    motor hace falta esperar `N * L / utilization` entre parciales. Si el
+    motor agrupa hasta `batch_size` sesiones en un lote, `L` ya es lo que
+    tarda un lote entero y sólo cuentan las rondas, `ceil(N / batch_size)`.
+    El resultado se acota a `[min_interval, max_interval]`; si haría falta más
+    que `max_interval`, el motor está sobrecargado y los parciales se omiten
+    (salvo un sondeo cada `probe_interval` para volver a medir), de modo que
+    los finales nunca esperan detrás de un parcial.
+    """
+
+    def __init__(
+        self,
+        min_interval: float = 0.25,
+        max_interval: float = 2.0,
+        utilization: float = 0.5,
+        probe_interval: float = 5.0,
+        batch_size: int = 1,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.utilization = utilization
+        self.probe_interval = probe_interval
+        self.batch_size = batch_size
+        self._speaking = set()
+        self._last_probe = 0.0
+        self._lock = threading.Lock()
+
+    def set_speaking(self, session, speaking: bool):
+        with self._lock:
+            if speaking:
+                self._speaking.add(session)
+            else:
+                self._speaking.discard(session)
+
+    @property
+    def speaking(self) -> int:
+        return len(self._speaking)
+
+    def interval(self, latency: float | None) -> float | None:
+        """Intervalo para una sesión cuyo parcial tarda `latency`; None = omitir."""
+        if latency is None:
+            return self.min_interval
+        rounds = math.ceil(max(1, self.speaking) / max(1, self.batch_size))
+        needed = latency * rounds / self.utilization
+        if needed <= self.max_interval:
+            return max(self.min_interval, needed)
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_probe >= self.probe_interval:
+                self._last_probe = now
+                return self.max_interval
+        return None
+
+
+class SessionPipeline:
+    """
+    Etapa de inferencia de una sesión, separada del hilo que lee el socket.
+
+    El receptor encola audio y peticiones de resultado final en una cola
+    acotada; un hilo propio alimenta el motor, calcula parciales y finales y
+    los entrega por callbacks. Así `recv()` nunca espera a una decodificación.
+
+    Políticas:
+    - El audio y los finales nunca se descartan. Si la cola se llena, el
+      receptor espera (backpressure) en lugar de crecer sin límite.
+    - Los parciales se omiten mientras haya trabajo pendiente en la cola: sólo
+      se calcula uno cuando el motor está al día, y como mucho uno cada
+      `partial_interval` segundos, o con el intervalo que dé `scheduler` a
+      partir del coste medido de los parciales de esta sesión.
+
+    Cada llamada al motor se mide en `metrics` (espera en cola, duración por
+    etapa, RTF por elocución) y, si se pasa `trace`, se anota en su log.
+    """
+
+    def __init__(
+        self,
+        engine: TranscriptionEngine,
+        on_partial,
+        on_final,
+        max_queue_items: int,
+        partial_interval: float = 0.0,
+        sample_rate: float = 16000.0,
+        trace=None,
+        scheduler: PartialScheduler | None = None,
+        latency_smoothing: float = 0.3,
+    ):
+        self.engine = engine
+        self.on_partial = on_partial
+        self.on_final = on_final
+        self.partial_interval = partial_interval
+        self.scheduler = scheduler
+        self.latency_smoothing = latency_smoothing
+        self.partial_latency = None
+        self.queue = queue.Queue(maxsize=max_queue_items)
+        self.closing = False
+        self.skipped_partials = 0
+        self.sample_rate = sample_rate
+        self.trace = trace or metrics.NullTrace()
+        self._last_partial_time = 0.0
+        self._utterance_audio_bytes = 0
+        self._utterance_engine_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _put(self, item, block: bool = True):
+        self.queue.put(item, block)
+        metrics.QUEUE_ITEMS.inc()
+
+    def submit_audio(self, audio: bytes):
+        metrics.QUEUE_DEPTH.observe(self.queue.qsize())
+        item = (AUDIO, audio, time.perf_counter())
+        try:
+            self._put(item, block=False)
+        except queue.Full:
+            print("Advertencia: la inferencia va retrasada, frenando la recepción...")
+            self.trace.event("backpressure", queued=self.queue.qsize())
+            self._put(item)
+
+    def submit_final(self, reason: str = "end"):
+        self._put((FINAL, reason, time.perf_counter()))
+
+    def submit_call(self, callback):
+        """Ejecuta `callback` en el hilo de inferencia, en orden con el resto."""
+        self._put((CALL, callback, time.perf_counter()))
+
+    @property
+    def backlog(self) -> int:
+        return self.queue.qsize()
+
+    def close(self):
+        """Procesa lo que quede en la cola (sin parciales) y detiene el hilo."""
+        self.closing = True
+        self._put(None)
+        self._thread.join()
+        if self.scheduler is not None:
+            self.scheduler.set_speaking(self, False)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            metrics.QUEUE_ITEMS.dec()
+            if item is None:
+                break
+            kind, payload, submitted_at = item
+            try:
+                if kind == AUDIO:
+                    waited = time.perf_counter() - submitted_at
+                    metrics.RECV_TO_ENGINE.observe(waited)
+                    self._process_audio(payload, waited)
+                elif kind == CALL:
+                    payload()
+                else:
+                    self._process_final(payload)
+            except Exception as e:
+                print(f"Error en la etapa de inferencia: {e}")
+
+    def _timed(self, stage: str, function, *args):
+        start = time.perf_counter()
+        with profiler.span(stage):
+            result = function(*args)
+        elapsed = time.perf_counter() - start
+        metrics.ENGINE_SECONDS.labels(stage).observe(elapsed)
+        self._utterance_engine_seconds += elapsed
+        return result, elapsed
+
+    def _process_final(self, reason: str):
+        if self.scheduler is not None:
+            self.scheduler.set_speaking(self, False)
+        text, elapsed = self._timed("final", self.engine.get_final_result)
+        self.engine.reset()
+        audio_seconds = self._utterance_audio_bytes / 2 / self.sample_rate
+        metrics.UTTERANCES.labels(reason).inc()
+        if audio_seconds > 0:
+            metrics.ENGINE_RTF.observe(self._utterance_engine_seconds / audio_seconds)
+        self.trace.event(
+            "final",
+            reason=reason,
+            decode_s=elapsed,
+            audio_s=audio_seconds,
+            engine_s=self._utterance_engine_seconds,
+            text=text,
+        )
+        self._utterance_audio_bytes = 0
+        self._utterance_engine_seconds = 0.0
+        self.on_final(text)
+
+    def _current_interval(self) -> float | None:
+        if self.scheduler is None:
+            return self.partial_interval
+        return self.scheduler.interval(self.partial_latency)
+
+    def _process_audio(self, audio: bytes, waited: float):
+        if self.scheduler is not None and not self._utterance_audio_bytes:
+            self.scheduler.set_speaking(self, True)
+        self._utterance_audio_bytes += len(audio)
+        metrics.AUDIO_SECONDS.inc(len(audio) / 2 / self.sample_rate)
+        finished, elapsed = self._timed("accept_waveform", self.engine.accept_waveform, audio)
+        self.trace.event("audio", bytes=len(audio), queue_wait_s=waited, decode_s=elapsed)
+        if finished:
+            return
+        if self.closing or not self.queue.empty():
+            self.skipped_partials += 1
+            metrics.SKIPPED_PARTIALS.inc()
+            return
+        interval = self._current_interval()
+        if interval is None:
+            self.skipped_partials += 1
+            metrics.OVERLOAD_SKIPPED_PARTIALS.inc()
+            return
+        current_time = time.time()
+        if current_time - self._last_partial_time < interval:
+            return
+        self._last_partial_time = current_time
+        partial_text, elapsed = self._timed("partial", self.engine.get_partial_result)
+        if self.partial_latency is None:
+            self.partial_latency = elapsed
+        else:
+            self.partial_latency += self.latency_smoothing * (elapsed - self.partial_latency)
+        metrics.PARTIAL_INTERVAL.observe(interval)
+        self.trace.event("partial", decode_s=elapsed, text=partial_text)
+        if partial_text:
+            self.on_partial(partial_text)
@@ -0,0 +1,139 @@
+import collections
+import threading
+import time
+from contextlib import contextmanager
+
+from escritor import TranscriptionEngine
+
+
+WARMING = "warming"
+READY = "ready"
+FAILED = "failed"
+
+
+class EnginePool:
+    """
+    Reparte sesiones de un motor cuyo modelo se carga una sola vez.
+
+    Cada préstamo recibe un motor con estado propio (recognizer, buffers)
+    creado con `new_session()`, por lo que la memoria no crece con el número
+    de dispositivos. Como máximo `max_sessions` préstamos están activos a la
+    vez; el resto espera en una cola FIFO.
+
+    El motor se construye con `engine_factory` en segundo plano al llamar a
+    `start()`, de modo que el servidor puede aceptar conexiones mientras el
+    modelo carga y se calienta. Los préstamos esperan hasta que esté listo.
+    """
+
+    def __init__(self, engine_factory, max_sessions: int):
+        if max_sessions < 1:
+            raise ValueError("max_sessions debe ser al menos 1.")
+        self.engine_factory = engine_factory
+        self.engine = None
+        self.max_sessions = max_sessions
+        self.status = WARMING
+        self.error = None
+        self._ready = threading.Event()
+        self._free = []
+        self._active = 0
+        self._waiting = collections.deque()
+        self._condition = threading.Condition()
+
+    def start(self, warm_up: bool = True, on_failure=None):
+        """Carga (y opcionalmente calienta) el motor en un hilo aparte."""
+        threading.Thread(
+            target=self._load, args=(warm_up, on_failure), daemon=True
+        ).start()
+
+    def load(self, warm_up: bool = True):
+        """Carga el motor en el hilo actual."""
+        engine = self.engine_factory()
+        if warm_up:
+            start = time.perf_counter()
+            engine.warm_up()
+            print(f"Motor calentado en {time.perf_counter() - start:.2f} s.")
+        with self._condition:
+            self.engine = engine
+            self._free.append(engine)
+            self.status = READY
+        self._ready.set()
+
+    def _load(self, warm_up: bool, on_failure):
+        try:
+            self.load(warm_up)
+        except Exception as e:
+            print(f"Error fatal al inicializar el motor de transcripción: {e}")
+            self.error = e
+            self.status = FAILED
+            self._ready.set()
+            if on_failure is not None:
+                on_failure(e)
+
+    def wait_ready(self, timeout: float | None = None) -> bool:
+        return self._ready.wait(timeout) and self.status == READY
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiting)
+
+    def acquire(self, timeout: float | None = None) -> TranscriptionEngine:
+        """
+        Espera su turno y devuelve un motor de sesión.
+        Lanza TimeoutError si no hay hueco antes de `timeout` segundos.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not self._ready.wait(timeout):
+            raise TimeoutError(f"El motor sigue cargando tras {timeout} segundos.")
+        if self.status == FAILED:
+            raise RuntimeError(f"El motor no pudo cargarse: {self.error}")
+        if deadline is not None:
+            timeout = max(0.0, deadline - time.monotonic())
+
+        ticket = object()
+        with self._condition:
+            self._waiting.append(ticket)
+            try:
+                has_turn = self._condition.wait_for(
+                    lambda: self._waiting[0] is ticket
+                    and self._active < self.max_sessions,
+                    timeout=timeout,
+                )
+                if not has_turn:
+                    raise TimeoutError(
+                        f"No hay motores libres tras {timeout} segundos de espera."
+                    )
+                self._active += 1
+            finally:
+                self._waiting.remove(ticket)
+                self._condition.notify_all()
+            engine = self._free.pop() if self._free else None
+
+        if engine is None:
+            try:
+                engine = self.engine.new_session()
+            except Exception:
+                self.release(None)
+                raise
+        engine.reset()
+        return engine
+
+    def release(self, engine: TranscriptionEngine | None):
+        """Devuelve un motor al pool y despierta al siguiente en la cola."""
+        with self._condition:
+            if engine is not None:
+                self._free.append(engine)
+            self._active -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def lease(self, timeout: float | None = None):
+        engine = self.acquire(timeout)
+        try:
+            yield engine
+        finally:
+            engine.reset()
+            self.release(engine)
@@ -94,7 +94,10 @@ class TranscriptionPopup(Window):
         self.close_button.connect("clicked", self.on_close_clicked)
         self.copy_button.connect("clicked", self.on_copy_clicked)
 
-        self.close_event = None
+        # Sesión que está mostrando su texto (el popup es compartido) y marca
+        # del resultado final mostrado, para el ocultado automático.
+        self.owner = None
+        self.final_token = None
 
         main_box = Box(
             name="popup-box",
@@ -110,8 +113,6 @@ class TranscriptionPopup(Window):
         self.hide()
 
     def on_close_clicked(self, widget):
-        if self.close_event:
-            self.close_event.set()
         self.hide()
 
     def on_copy_clicked(self, widget):
@@ -125,16 +126,33 @@ class TranscriptionPopup(Window):
             except Exception as e:
                 print(f"Error al copiar al portapapeles: {e}")
 
-    def show_final_result(self, text, event_to_signal):
-        """Muestra el texto final, el botón de cierre y guarda el evento a señalar."""
-        self.update_text(text)
-        self.close_event = event_to_signal
+    def show_final_result(self, text, owner=None, timeout: float | None = None):
+        """
+        Muestra el texto final y el botón de cierre. Con `timeout`, el popup
+        se oculta solo pasados esos segundos si nadie lo ha reemplazado.
+        """
+        self.update_text(text, owner)
         self.close_button.show()
         self.queue_resize()
+        if timeout:
+            token = self.final_token = object()
+            GLib.timeout_add(int(timeout * 1000), self._expire, token)
+
+    def _expire(self, token):
+        if self.final_token is token:
+            print("Timeout de espera. Ocultando popup automáticamente.")
+            self.hide()
+        return False
+
+    def hide_for(self, owner):
+        """Oculta el popup sólo si lo está usando la sesión `owner`."""
+        if self.owner is owner:
+            self.hide()
 
     def hide(self):
         self.close_button.hide()
-        self.close_event = None
+        self.owner = None
+        self.final_token = None
         super().hide()
 
     def apply_theme(self, *args):
@@ -144,7 +162,10 @@ class TranscriptionPopup(Window):
             final_css = load_pywal_css(CSS_STYLES_TEMPLATE)
             app.set_stylesheet_from_string(final_css)
 
-    def update_text(self, text: str):
+    def update_text(self, text: str, owner=None):
+        if owner is not None:
+            self.owner = owner
+        self.final_token = None
         if "Escuchando..." in text or "..." in text:
             self.close_button.hide()
 
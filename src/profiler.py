@@ -0,0 +1,168 @@
+"""
+Modo perfilado del servidor (`python main.py --profile`).
+
+Dos fuentes, ambas en formato "collapsed stack" (una pila por línea, marcos
+separados por ";" y un peso al final) que entienden flamegraph.pl y
+speedscope:
+
+- Spans: `with profiler.span("gain"):` alrededor de cada etapa del camino
+  caliente. Anidados por hilo; el peso es el tiempo propio en microsegundos.
+  Con el perfilado desactivado `span()` devuelve un contexto vacío y no mide.
+- Muestreo: un hilo lee `sys._current_frames()` cada `interval` segundos y
+  cuenta las pilas de Python de todos los hilos.
+
+Al terminar, `stop()` escribe `<prefijo>.spans.folded`,
+`<prefijo>.samples.folded` y muestra un resumen por etapa.
+"""
+
+import collections
+import contextlib
+import sys
+import threading
+import time
+
+ENABLED = False
+
+_NULL_SPAN = contextlib.nullcontext()
+_local = threading.local()
+_lock = threading.Lock()
+# Etapa -> [llamadas, segundos totales, máximo]
+_stages = collections.defaultdict(lambda: [0, 0.0, 0.0])
+# Pila "hilo;etapa;subetapa" -> microsegundos de tiempo propio
+_span_stacks = collections.Counter()
+_sampler = None
+
+
+class _Span:
+    __slots__ = ("name", "start", "children")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.children = 0.0
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = [threading.current_thread().name]
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        stack = _local.stack
+        path = ";".join(
+            frame if isinstance(frame, str) else frame.name for frame in stack
+        )
+        stack.pop()
+        parent = stack[-1]
+        if not isinstance(parent, str):
+            parent.children += elapsed
+        with _lock:
+            stage = _stages[self.name]
+            stage[0] += 1
+            stage[1] += elapsed
+            stage[2] = max(stage[2], elapsed)
+            _span_stacks[path] += int((elapsed - self.children) * 1e6)
+        return False
+
+
+def span(name: str):
+    """Mide la etapa `name` si el perfilado está activo."""
+    if not ENABLED:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def wrap(name: str, function):
+    """
+    Envuelve un callback para medir, además de su ejecución, cuánto esperó
+    en cola (`<name>_queue`). Pensado para `GLib.idle_add`.
+    """
+    if not ENABLED:
+        return function
+    queued_at = time.perf_counter()
+
+    def wrapper(*args):
+        waited = time.perf_counter() - queued_at
+        with _lock:
+            stage = _stages[f"{name}_queue"]
+            stage[0] += 1
+            stage[1] += waited
+            stage[2] = max(stage[2], waited)
+        with _Span(name):
+            return function(*args)
+
+    return wrapper
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, interval: float):
+        super().__init__(name="profiler-sampler", daemon=True)
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._halt = threading.Event()
+
+    def run(self):
+        names = {}
+        while not self._halt.wait(self.interval):
+            names.update((t.ident, t.name) for t in threading.enumerate())
+            for ident, frame in sys._current_frames().items():
+                if ident == self.ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._halt.set()
+        self.join()
+
+
+def start(interval: float = 0.005):
+    """Activa los spans y arranca el hilo de muestreo."""
+    global ENABLED, _sampler
+    ENABLED = True
+    _sampler = _Sampler(interval)
+    _sampler.start()
+
+
+def _write_folded(path: str, stacks: collections.Counter):
+    with open(path, "w") as f:
+        for stack, weight in stacks.most_common():
+            if weight > 0:
+                f.write(f"{stack} {weight}\n")
+
+
+def summary() -> str:
+    with _lock:
+        stages = sorted(_stages.items(), key=lambda item: item[1][1], reverse=True)
+    lines = [f"{'etapa':<24}{'llamadas':>10}{'total s':>10}{'media ms':>10}{'máx ms':>10}"]
+    for name, (count, total, maximum) in stages:
+        lines.append(
+            f"{name:<24}{count:>10}{total:>10.2f}{total / count * 1000:>10.2f}"
+            f"{maximum * 1000:>10.2f}"
+        )
+    return "\n".join(lines)
+
+
+def stop(prefix: str = "profile"):
+    """Detiene el muestreo, escribe los ficheros .folded y muestra el resumen."""
+    global ENABLED
+    if not ENABLED:
+        return
+    ENABLED = False
+    _sampler.stop()
+    with _lock:
+        spans = collections.Counter(_span_stacks)
+    _write_folded(f"{prefix}.spans.folded", spans)
+    _write_folded(f"{prefix}.samples.folded", _sampler.stacks)
+    print(f"\nPerfil ({_sampler.samples} muestras):")
+    print(summary())
+    print(f"Pilas en {prefix}.spans.folded y {prefix}.samples.folded (flamegraph.pl).")
@@ -0,0 +1,193 @@
+"""
+Protocolo enmarcado entre los clientes (Atom Echo, local_client.py) y el servidor.
+
+Al conectar, el cliente envía una cabecera fija:
+
+    magic "ESPW" | versión u8 | codec u8 | canales u8 | reservado u8 | sample_rate u32
+
+Después, todo viaja en tramas `tipo u8 | longitud u16 | payload` (little endian).
+El servidor sólo envía tramas (PING, STATUS) a clientes enmarcados. Si el
+cliente lo pide con una trama CONFIG `{"results": true}`, también recibe los
+textos parciales y finales (PARTIAL, FINAL).
+Los clientes que no envían la cabecera se tratan con el protocolo heredado:
+PCM crudo con el marcador "[END]" en banda.
+"""
+
+import json
+import socket
+import struct
+
+from utils import ReceiveBuffer
+
+MAGIC = b"ESPW"
+VERSION = 1
+
+CODEC_PCM16 = 0
+CODEC_IMA_ADPCM = 1
+CODEC_OPUS = 2
+
+AUDIO = 1
+END = 2
+PING = 3
+CONFIG = 4
+# Servidor -> cliente: "warming" mientras el modelo carga, "ready" al terminar.
+STATUS = 5
+# Servidor -> cliente, sólo con CONFIG {"results": true}: texto UTF-8.
+PARTIAL = 6
+FINAL = 7
+
+LEGACY_END_MARKER = b"[END]"
+
+HEADER = struct.Struct("<4sBBBBI")
+FRAME_HEADER = struct.Struct("<BH")
+MAX_PAYLOAD = 8192
+MAX_FRAME_SIZE = FRAME_HEADER.size + MAX_PAYLOAD
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def encode_header(sample_rate: int, codec: int = CODEC_PCM16, channels: int = 1) -> bytes:
+    return HEADER.pack(MAGIC, VERSION, codec, channels, 0, int(sample_rate))
+
+
+def encode_frame(frame_type: int, payload: bytes = b"") -> bytes:
+    if len(payload) > MAX_PAYLOAD:
+        raise ProtocolError(f"Payload de {len(payload)} bytes excede {MAX_PAYLOAD}.")
+    return FRAME_HEADER.pack(frame_type, len(payload)) + payload
+
+
+def encode_config(config: dict) -> bytes:
+    return encode_frame(CONFIG, json.dumps(config).encode("utf-8"))
+
+
+def decode_config(payload) -> dict:
+    try:
+        config = json.loads(bytes(payload).decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ProtocolError(f"CONFIG no es JSON válido: {e}") from e
+    if not isinstance(config, dict):
+        raise ProtocolError("CONFIG debe ser un objeto JSON.")
+    return config
+
+
+def encode_status(status: str) -> bytes:
+    return encode_frame(STATUS, status.encode("utf-8"))
+
+
+def encode_text(frame_type: int, text: str) -> bytes:
+    """Trama de texto; se recorta a MAX_PAYLOAD bytes sin partir caracteres."""
+    payload = text.encode("utf-8")[:MAX_PAYLOAD]
+    return encode_frame(frame_type, payload.decode("utf-8", "ignore").encode("utf-8"))
+
+
+def peek_is_framed(conn: socket.socket, timeout: float) -> bool:
+    """
+    Comprueba sin consumir datos si el cliente empezó con la cabecera del
+    protocolo enmarcado. Los clientes heredados (o que aún no envían nada)
+    devuelven False al agotarse `timeout`.
+    """
+    previous_timeout = conn.gettimeout()
+    conn.settimeout(timeout)
+    try:
+        head = conn.recv(len(MAGIC), socket.MSG_PEEK | socket.MSG_WAITALL)
+    except (socket.timeout, OSError):
+        return False
+    finally:
+        conn.settimeout(previous_timeout)
+    return head == MAGIC
+
+
+class StreamHeader:
+    def __init__(self, version: int, codec: int, channels: int, sample_rate: int):
+        self.version = version
+        self.codec = codec
+        self.channels = channels
+        self.sample_rate = sample_rate
+
+
+class StreamReader:
+    """
+    Lee del socket sobre un ReceiveBuffer y convierte los bytes en eventos
+    `(tipo, payload)`. Detecta en los primeros bytes si el cliente usa el
+    protocolo enmarcado o el heredado.
+
+    Los payload son memoryviews sobre el buffer: sólo son válidos hasta pedir
+    el siguiente evento.
+    """
+
+    def __init__(self, recv_size: int, framed: bool = False):
+        self.buffer = ReceiveBuffer(recv_size, reserve=MAX_FRAME_SIZE)
+        # Con `framed` no se espera cabecera (p. ej. un cliente que lee las
+        # tramas del servidor).
+        self.legacy = False if framed else None
+        self.header = None
+
+    def read(self, conn) -> int:
+        return self.buffer.recv_into(conn)
+
+    def events(self):
+        """Genera los eventos completos que hay en el buffer."""
+        if self.legacy is None and not self._detect():
+            return
+        if self.legacy:
+            yield from self._legacy_events()
+        else:
+            yield from self._framed_events()
+
+    def _detect(self) -> bool:
+        buffer = self.buffer
+        checked = min(buffer.length, len(MAGIC))
+        if not buffer.buffer.startswith(MAGIC[:checked], 0, checked):
+            self.legacy = True
+            return True
+        if buffer.length < HEADER.size:
+            return False
+
+        magic, version, codec, channels, _, sample_rate = HEADER.unpack_from(
+            buffer.buffer, 0
+        )
+        if version != VERSION:
+            raise ProtocolError(f"Versión de protocolo {version} no soportada.")
+        self.header = StreamHeader(version, codec, channels, sample_rate)
+        self.legacy = False
+        buffer.consume(HEADER.size)
+        return True
+
+    def _framed_events(self):
+        buffer = self.buffer
+        offset = 0
+        try:
+            while buffer.length - offset >= FRAME_HEADER.size:
+                frame_type, size = FRAME_HEADER.unpack_from(buffer.buffer, offset)
+                if size > MAX_PAYLOAD:
+                    raise ProtocolError(f"Trama de {size} bytes excede {MAX_PAYLOAD}.")
+                start = offset + FRAME_HEADER.size
+                if buffer.length - start < size:
+                    break
+                offset = start + size
+                yield frame_type, buffer.view[start:offset]
+        finally:
+            buffer.consume(offset)
+
+    def _legacy_events(self):
+        buffer = self.buffer
+        end_signal_pos = buffer.find(LEGACY_END_MARKER)
+        if end_signal_pos != -1:
+            if end_signal_pos > 1:
+                yield AUDIO, buffer.data(end_signal_pos - end_signal_pos % 2)
+            yield END, buffer.data(0)
+            buffer.clear()
+            return
+
+        # Sólo se entregan muestras completas; los bytes que podrían ser el
+        # inicio de un "[END]" se quedan en el buffer para la siguiente lectura.
+        usable = buffer.length - buffer.pending_marker(LEGACY_END_MARKER)
+        usable -= usable % 2
+        if usable:
+            yield AUDIO, buffer.data(usable)
+            buffer.consume(usable)
+
+    def clear(self):
+        self.buffer.clear()
@@ -0,0 +1,150 @@
+"""
+Reparto de los núcleos de CPU entre las decodificaciones concurrentes.
+
+torch, CTranslate2, ONNX Runtime y las librerías BLAS de Kaldi crean cada
+uno su propio pool de hilos con un hilo por núcleo. Con varias sesiones
+decodificando a la vez los pools se pisan (más hilos que núcleos) y la
+latencia de cola se dispara. `ExecutionResources` fija un número de hilos
+por decodificación, deja correr sólo tantas decodificaciones como quepan en
+los núcleos disponibles y, opcionalmente, fija cada una a su propio grupo de
+núcleos:
+
+    resources = ExecutionResources.for_engine(concurrent_decodes=4)
+    resources.apply_environment()   # antes de importar torch/vosk
+    with resources.slot():
+        model.generate(...)
+
+El fijado de núcleos se aplica al hilo que llama a `slot()` (y a los hilos
+que cree mientras lo tiene); los pools que ya existían conservan su
+afinidad.
+"""
+
+import contextlib
+import os
+import threading
+import time
+
+import metrics
+import profiler
+
+# Variables que leen OpenMP, MKL y OpenBLAS al crear su pool de hilos.
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+def available_cores() -> list[int]:
+    """Núcleos en los que puede ejecutarse este proceso."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class ExecutionResources:
+    """
+    Hilos por decodificación y número máximo de decodificaciones a la vez.
+
+    Sin `threads_per_decode` no se limita nada (cada librería usa su valor
+    por defecto). Si no se indica `max_concurrent`, se deja correr una
+    decodificación por cada `threads_per_decode` núcleos.
+    """
+
+    def __init__(
+        self,
+        threads_per_decode: int | None = None,
+        max_concurrent: int | None = None,
+        pin_cores: bool = False,
+        cores: list[int] | None = None,
+    ):
+        self.cores = list(cores) if cores is not None else available_cores()
+        self.threads_per_decode = (
+            min(threads_per_decode, len(self.cores)) if threads_per_decode else None
+        )
+        if max_concurrent is None and self.threads_per_decode:
+            max_concurrent = max(1, len(self.cores) // self.threads_per_decode)
+        self.max_concurrent = max_concurrent
+        self.pin_cores = pin_cores and self.threads_per_decode is not None
+
+        self._free_slots = []
+        self._condition = threading.Condition()
+        if max_concurrent:
+            # Grupos de núcleos disjuntos mientras alcancen; si hay más
+            # decodificaciones que grupos, se reparten en rueda.
+            size = self.threads_per_decode or max(1, len(self.cores) // max_concurrent)
+            groups = max(1, len(self.cores) // size)
+            self._free_slots = [
+                self.cores[(i % groups) * size : (i % groups + 1) * size]
+                for i in range(max_concurrent)
+            ]
+
+    @classmethod
+    def for_engine(
+        cls,
+        concurrent_decodes: int | None,
+        threads_per_decode: int | None = None,
+        max_concurrent: int | None = None,
+        pin_cores: bool = False,
+        cores: list[int] | None = None,
+    ) -> "ExecutionResources":
+        """
+        Reparte los núcleos entre las `concurrent_decodes` decodificaciones
+        que el motor puede ejecutar a la vez: un motor que decodifica en un
+        solo hilo de inferencia (el lote de Whisper) recibe todos los núcleos,
+        y uno con varios workers, su parte. `None` = una por núcleo (Vosk,
+        que decodifica en un solo hilo). `threads_per_decode` fuerza el valor.
+        """
+        cores = list(cores) if cores is not None else available_cores()
+        if not threads_per_decode:
+            threads_per_decode = max(1, len(cores) // (concurrent_decodes or len(cores)))
+        return cls(threads_per_decode, max_concurrent, pin_cores, cores)
+
+    def apply_environment(self):
+        """
+        Limita los pools de OpenMP/MKL/OpenBLAS. Sólo tiene efecto si se llama
+        antes de que se cargue la librería; respeta las variables ya definidas.
+        """
+        if self.threads_per_decode:
+            for name in THREAD_ENV_VARS:
+                os.environ.setdefault(name, str(self.threads_per_decode))
+
+    def configure_torch(self, torch):
+        """Hilos intra-op de torch e inter-op a 1 (las sesiones ya son paralelas)."""
+        if not self.threads_per_decode:
+            return
+        torch.set_num_threads(self.threads_per_decode)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Sólo se puede fijar antes del primer trabajo paralelo de torch.
+            pass
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Espera un hueco libre para decodificar y lo ocupa durante el bloque."""
+        if not self.max_concurrent:
+            yield
+            return
+        start = time.perf_counter()
+        with profiler.span("decode_slot_wait"), self._condition:
+            while not self._free_slots:
+                self._condition.wait()
+            cores = self._free_slots.pop()
+        metrics.DECODE_SLOT_WAIT.observe(time.perf_counter() - start)
+        metrics.ACTIVE_DECODES.inc()
+
+        thread_id = threading.get_native_id()
+        previous = None
+        if self.pin_cores:
+            previous = os.sched_getaffinity(thread_id)
+            os.sched_setaffinity(thread_id, cores)
+        try:
+            yield
+        finally:
+            if previous is not None:
+                os.sched_setaffinity(thread_id, previous)
+            metrics.ACTIVE_DECODES.dec()
+            with self._condition:
+                self._free_slots.append(cores)
+                self._condition.notify()
+
+
+# Sin límites: lo que usan los motores a los que no se les pasa `resources`.
+UNMANAGED = ExecutionResources()
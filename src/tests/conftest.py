@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los módulos del servidor se importan por nombre desde src/.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,88 @@
+import numpy as np
+
+import escritor as esc
+
+SAMPLE_RATE = 16000
+
+
+def make_whisper_engine(**overrides) -> esc.WhisperEngine:
+    """WhisperEngine sin cargar el modelo: `_generate` devuelve un texto por pasada."""
+    engine = esc.WhisperEngine.__new__(esc.WhisperEngine)
+    engine.sample_rate = SAMPLE_RATE
+    engine.channels = 1
+    engine.bytes_per_sample = 2
+    engine.bytes_per_second = SAMPLE_RATE * 2
+    engine.CHUNK_SECONDS = 30
+    engine.bytes_per_chunk = engine.bytes_per_second * engine.CHUNK_SECONDS
+    engine.audio_buffer = bytearray()
+    engine.audio_version = 0
+    engine.features = None
+    engine.streaming = False
+    engine.reuse_partials = False
+    engine.encoder_cache = None
+    engine.previous_tokens = []
+    engine.previous_segments = []
+    engine.transcribed_text = ""
+    engine.last_partial_result = ""
+    engine.last_partial_time = 0
+    engine.seconds_between_partial = 0.0
+    engine.batcher = None
+    engine.__dict__.update(overrides)
+
+    engine.generated = []
+
+    def generate(audio_np, return_timestamps=False, features=None):
+        engine.generated.append(len(audio_np))
+        return f"pasada{len(engine.generated)}"
+
+    engine._generate = generate
+    return engine
+
+
+def test_final_without_partials_transcribes_every_chunk():
+    engine = make_whisper_engine()
+    engine.accept_waveform(np.zeros(SAMPLE_RATE * 45, dtype=np.int16).tobytes())
+
+    text = engine.get_final_result()
+
+    # 45 s = un bloque completo de 30 s + 15 s de cola, ninguno truncado.
+    assert engine.generated == [SAMPLE_RATE * 30, SAMPLE_RATE * 15]
+    assert text == "pasada1 pasada2"
+    assert not engine.audio_buffer
+
+
+def test_final_after_partials_does_not_repeat_committed_chunks():
+    engine = make_whisper_engine()
+    engine.accept_waveform(np.zeros(SAMPLE_RATE * 31, dtype=np.int16).tobytes())
+    engine.get_partial_result()
+    engine.accept_waveform(np.zeros(SAMPLE_RATE * 40, dtype=np.int16).tobytes())
+
+    text = engine.get_final_result()
+
+    # Parcial: bloque 1 + cola de 1 s. Final: bloque 2 + cola de 11 s.
+    assert engine.generated == [
+        SAMPLE_RATE * 30,
+        SAMPLE_RATE * 1,
+        SAMPLE_RATE * 30,
+        SAMPLE_RATE * 11,
+    ]
+    assert text == "pasada1 pasada3 pasada4"
+
+
+def test_streaming_partial_keeps_the_unclosed_tail_after_a_commit():
+    engine = make_whisper_engine(
+        streaming=True, max_tail_bytes=SAMPLE_RATE * 2 * 15, previous_segments=["hola"]
+    )
+    engine.accept_waveform(np.zeros(SAMPLE_RATE * 4, dtype=np.int16).tobytes())
+    # "hola" coincide con la hipótesis anterior; "qué tal" no tiene segmento
+    # cerrado todavía.
+    engine._transcribe_segments = lambda audio, features=None: (
+        "hola mundo, qué tal",
+        [("hola", 0.0, 1.0), ("mundo,", 1.0, 2.0)],
+    )
+
+    partial = engine.get_partial_result()
+
+    assert partial == "hola mundo, qué tal"
+    assert engine.transcribed_text == "hola "
+    assert engine.previous_segments == ["mundo,"]
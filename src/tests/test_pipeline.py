@@ -0,0 +1,33 @@
+from pipeline import PartialScheduler
+
+
+def speaking_scheduler(sessions: int, **options) -> PartialScheduler:
+    scheduler = PartialScheduler(
+        min_interval=0.25, max_interval=2.0, utilization=0.5, **options
+    )
+    for session in range(sessions):
+        scheduler.set_speaking(session, True)
+    return scheduler
+
+
+def test_serial_engine_scales_with_speaking_sessions():
+    scheduler = speaking_scheduler(2)
+    assert scheduler.interval(0.4) == 1.6
+
+
+def test_batching_engine_counts_one_round_per_batch():
+    # El lote de 4 sirve a las 4 sesiones en una pasada de 0.5 s.
+    scheduler = speaking_scheduler(4, batch_size=4)
+    assert scheduler.interval(0.5) == 1.0
+
+
+def test_batching_engine_counts_extra_rounds_past_batch_size():
+    scheduler = speaking_scheduler(5, batch_size=4)
+    assert scheduler.interval(0.25) == 1.0
+
+
+def test_overload_skips_partials_between_probes():
+    scheduler = speaking_scheduler(4)
+    # 0.5 s * 4 sesiones / 0.5 = 4 s > max_interval: sondeo y luego omitir.
+    assert scheduler.interval(0.5) == 2.0
+    assert scheduler.interval(0.5) is None
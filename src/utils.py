@@ -1,6 +1,6 @@
 import time
+import wave
 import numpy as np
-from gi.repository import GLib
 
 
 def increase_volume_pcm16(audio_bytes, multiplier):
@@ -15,7 +15,74 @@ def increase_volume_pcm16(audio_bytes, multiplier):
         return audio_bytes
 
 
+class PcmGain:
+    """
+    Ganancia in-place para PCM de 16 bits. Usa aritmética entera en punto fijo
+    (Q8) sobre un buffer de trabajo preasignado, sin crear arrays nuevos.
+    """
+
+    def __init__(self, multiplier: float, max_samples: int):
+        self.gain = int(round(multiplier * 256))
+        self.scratch = np.empty(max_samples, dtype=np.int32)
+
+    def apply(self, audio: memoryview) -> memoryview:
+        samples = np.frombuffer(audio, dtype=np.int16)
+        if len(samples) > len(self.scratch):
+            self.scratch = np.empty(len(samples), dtype=np.int32)
+        work = self.scratch[: len(samples)]
+        np.multiply(samples, self.gain, out=work, dtype=np.int32)
+        np.right_shift(work, 8, out=work)
+        np.clip(work, -32768, 32767, out=work)
+        samples[...] = work
+        return audio
+
+
+class ReceiveBuffer:
+    """
+    Buffer de recepción preasignado. Los datos se leen con `recv_into` sobre
+    un memoryview; al consumir, sólo los pocos bytes sobrantes (media muestra
+    o el inicio de un marcador) se mueven al principio del buffer.
+    """
+
+    def __init__(self, size: int, reserve: int = 8):
+        self.buffer = bytearray(size + reserve)
+        self.view = memoryview(self.buffer)
+        self.size = size
+        self.length = 0
+
+    def recv_into(self, conn) -> int:
+        received = conn.recv_into(self.view[self.length : self.length + self.size])
+        self.length += received
+        return received
+
+    def find(self, marker: bytes) -> int:
+        return self.buffer.find(marker, 0, self.length)
+
+    def pending_marker(self, marker: bytes) -> int:
+        """Bytes del final que podrían ser el comienzo de `marker`."""
+        for size in range(min(len(marker) - 1, self.length), 0, -1):
+            if self.buffer.startswith(marker[:size], self.length - size, self.length):
+                return size
+        return 0
+
+    def data(self, end: int) -> memoryview:
+        return self.view[:end]
+
+    def consume(self, count: int):
+        remaining = self.length - count
+        if remaining > 0:
+            self.buffer[:remaining] = self.buffer[count : self.length]
+        self.length = max(remaining, 0)
+
+    def clear(self):
+        self.length = 0
+
+
 def get_final_result(engine, popup_window, addr, popup_is_visible):
+    # GLib sólo se importa aquí: protocol, audio_codec y los benchmarks usan
+    # este módulo en máquinas sin GTK.
+    from gi.repository import GLib
+
     text = engine.get_final_result()
     if text:
         print(f"[{addr}] Final: {text}")
@@ -27,3 +94,37 @@ def get_final_result(engine, popup_window, addr, popup_is_visible):
         GLib.idle_add(popup_window.hide)
 
     print(f"[{addr}] Transcipcion finalizada.")
+
+
+def load_pcm16(path: str, sample_rate: int = 16000) -> bytes:
+    """Lee un WAV mono de 16 bits (o un .pcm crudo) y devuelve sus muestras."""
+    if not path.endswith(".wav"):
+        with open(path, "rb") as f:
+            return f.read()
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+            raise ValueError(f"'{path}' no es PCM mono de 16 bits.")
+        if wav.getframerate() != sample_rate:
+            raise ValueError(f"'{path}' no está a {sample_rate} Hz.")
+        return wav.readframes(wav.getnframes())
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """WER por distancia de Levenshtein entre palabras."""
+    ref = reference.lower().split()
+    hyp = hypothesis.lower().split()
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (ref_word != hyp_word),
+                )
+            )
+        previous = current
+    return previous[-1] / len(ref)
@@ -0,0 +1,112 @@
+import collections
+
+import numpy as np
+
+try:
+    import webrtcvad
+except ImportError:
+    webrtcvad = None
+
+
+class VoiceActivityDetector:
+    """
+    Detector de actividad de voz delante del motor de transcripción.
+
+    Divide el audio en tramas de `frame_ms`, descarta las de silencio y marca
+    el final de la elocución tras `endpoint_ms` de silencio después de voz.
+    Usa webrtcvad si está instalado; si no, un detector de energía con suelo
+    de ruido adaptativo. Se conservan `pad_ms` de audio antes y después de la
+    voz para no cortar el inicio ni el final de las palabras.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        frame_ms: int = 20,
+        endpoint_ms: int = 400,
+        pad_ms: int = 200,
+        aggressiveness: int = 2,
+        min_rms: float = 300.0,
+        speech_ratio: float = 3.0,
+    ):
+        self.sample_rate = int(sample_rate)
+        self.frame_samples = self.sample_rate * frame_ms // 1000
+        self.frame_bytes = self.frame_samples * 2
+        self.endpoint_frames = max(1, endpoint_ms // frame_ms)
+        self.pad_frames = pad_ms // frame_ms
+        self.min_rms = min_rms
+        self.speech_ratio = speech_ratio
+        self.webrtc = webrtcvad.Vad(aggressiveness) if webrtcvad else None
+
+        self.pending = bytearray()
+        self.output = bytearray()
+        self.noise_floor = min_rms / speech_ratio
+        self.reset()
+
+    def reset(self):
+        self.pending.clear()
+        self.pre_speech = collections.deque(maxlen=self.pad_frames)
+        self.end_utterance()
+
+    def end_utterance(self):
+        """
+        Cierra la elocución en curso sin tocar el audio pendiente ni el
+        pre-roll: tras un final por silencio, ese audio es el comienzo de la
+        siguiente elocución.
+        """
+        self.in_utterance = False
+        self.silent_frames = 0
+
+    def _is_speech(self, frame: bytes, rms: float) -> bool:
+        if self.webrtc is not None:
+            return self.webrtc.is_speech(frame, self.sample_rate)
+        speech = rms > max(self.min_rms, self.noise_floor * self.speech_ratio)
+        if not speech:
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * rms
+        return speech
+
+    def process(self, audio: memoryview) -> tuple[bytes, bool]:
+        """
+        Devuelve el audio que debe llegar al motor y si la elocución terminó.
+        Tras un final, las tramas restantes se quedan pendientes para que no
+        se mezclen con la elocución que acaba de cerrarse; para conservarlas,
+        cerrar la elocución con `end_utterance()` y no con `reset()`.
+        """
+        self.pending.extend(audio)
+        usable = len(self.pending) - len(self.pending) % self.frame_bytes
+        self.output.clear()
+        endpoint = False
+        if not usable:
+            return b"", endpoint
+
+        frames = np.frombuffer(
+            self.pending, dtype=np.int16, count=usable // 2
+        ).reshape(-1, self.frame_samples)
+        energies = np.sqrt(np.mean(frames.astype(np.float32) ** 2, axis=1))
+        del frames
+
+        processed = 0
+        for rms in energies:
+            frame = bytes(self.pending[processed : processed + self.frame_bytes])
+            processed += self.frame_bytes
+            if self._is_speech(frame, float(rms)):
+                if not self.in_utterance:
+                    self.in_utterance = True
+                    for padding in self.pre_speech:
+                        self.output.extend(padding)
+                    self.pre_speech.clear()
+                self.silent_frames = 0
+                self.output.extend(frame)
+            elif self.in_utterance:
+                self.silent_frames += 1
+                if self.silent_frames <= self.pad_frames:
+                    self.output.extend(frame)
+                if self.silent_frames >= self.endpoint_frames:
+                    self.end_utterance()
+                    endpoint = True
+                    break
+            else:
+                self.pre_speech.append(frame)
+
+        del self.pending[:processed]
+        return bytes(self.output), endpoint